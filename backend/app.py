@@ -1,19 +1,35 @@
 from __future__ import annotations
 
-import io
-import json
+import asyncio
+import gzip
+import logging
 import os
-import sys
-import subprocess
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
+import orjson
 import pandas as pd
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+from pipeline import (
+    step1_cluster,
+    step2_capacity,
+    step3_generate_titles,
+    step5_route_subreddits,
+    step7_generate_bodies,
+    step8_weekly_plan,
+    step9_assign_schedule,
+    step10_comment_plan,
+    step11_generate_comments,
+    step12_build_reddit_output,
+    step13_build_reddit_output_nested,
+)
+
+logger = logging.getLogger(__name__)
 
 # -------------------------
 # FastAPI
@@ -30,7 +46,46 @@ app.add_middleware(
 
 BASE_DIR = Path(__file__).resolve().parent
 COMPANIES_DIR = BASE_DIR / "companies"
-PIPELINE_DIR = BASE_DIR / "pipeline"
+
+# Pipeline steps in topological order. Each module exposes main(company_dir).
+PIPELINE_STEPS = {
+    "step1_cluster": step1_cluster.main,
+    "step2_capacity": step2_capacity.main,
+    "step3_generate_titles": step3_generate_titles.main,
+    "step5_route_subreddits": step5_route_subreddits.main,
+    "step7_generate_bodies": step7_generate_bodies.main,
+    "step8_weekly_plan": step8_weekly_plan.main,
+    "step9_assign_schedule": step9_assign_schedule.main,
+    "step10_comment_plan": step10_comment_plan.main,
+    "step11_generate_comments": step11_generate_comments.main,
+    "step12_build_reddit_output": step12_build_reddit_output.main,
+    "step13_build_reddit_output_nested": step13_build_reddit_output_nested.main,
+}
+
+# Steps whose output files each step reads (besides request.json / input_payload.json).
+# A step starts as soon as its deps finish, e.g. step2 overlaps the step1-step7 chain.
+PIPELINE_DEPS = {
+    "step1_cluster": [],
+    "step2_capacity": [],
+    "step3_generate_titles": ["step1_cluster"],
+    "step5_route_subreddits": ["step3_generate_titles"],
+    "step7_generate_bodies": ["step5_route_subreddits"],
+    "step8_weekly_plan": ["step2_capacity", "step7_generate_bodies"],
+    "step9_assign_schedule": ["step8_weekly_plan"],
+    "step10_comment_plan": ["step9_assign_schedule"],
+    "step11_generate_comments": ["step10_comment_plan"],
+    "step12_build_reddit_output": ["step10_comment_plan", "step11_generate_comments"],
+    "step13_build_reddit_output_nested": ["step12_build_reddit_output"],
+}
+
+# Campaign pipelines are CPU + LLM heavy; run them in worker processes so the
+# event loop stays free and concurrent campaigns use separate cores.
+EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    EXECUTOR.shutdown(wait=False, cancel_futures=True)
 
 
 # -------------------------
@@ -72,37 +127,113 @@ def ensure_company_dir(company_name: str) -> Path:
     return d
 
 
+UPLOAD_COLUMNS = (
+    "company_name",
+    "company_description",
+    "subreddit",
+    "persona_username",
+    "persona_info",
+    "keyword_id",
+    "keyword",
+    "target_posts_per_week",
+)
+
+
+def _is_upload_column(name: Any) -> bool:
+    return str(name).lower().strip() in UPLOAD_COLUMNS
+
+
 def write_json(path: Path, obj: Any) -> None:
-    path.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+
+def find_nested_output(company_dir: Path) -> Optional[Path]:
+    """step13 writes reddit_output_nested.json.gz; older campaigns may have plain .json."""
+    for name in ("reddit_output_nested.json.gz", "reddit_output_nested.json"):
+        path = company_dir / name
+        if path.exists():
+            return path
+    return None
+
+
+def read_json_file(path: Path) -> Any:
+    data = path.read_bytes()
+    if path.suffix == ".gz":
+        data = gzip.decompress(data)
+    return orjson.loads(data)
+
+
+def _run_step(step_name: str, company_dir: str) -> None:
+    try:
+        PIPELINE_STEPS[step_name](company_dir)
+    except Exception as e:
+        logger.exception("Pipeline step %s failed for %s", step_name, company_dir)
+        raise RuntimeError(f"{step_name} failed: {e}") from None
+
 
+async def _run_pipeline_dag(company_dir: str) -> None:
+    loop = asyncio.get_running_loop()
+    tasks: Dict[str, asyncio.Task] = {}
 
-def run_step(step_script: str, company_dir: Path, *extra_args: str) -> None:
+    async def run(step_name: str) -> None:
+        await asyncio.gather(*(tasks[dep] for dep in PIPELINE_DEPS[step_name]))
+        await loop.run_in_executor(None, _run_step, step_name, company_dir)
+
+    for step_name in PIPELINE_STEPS:
+        tasks[step_name] = asyncio.create_task(run(step_name))
+
+    # Stop at the first failure like the sequential runner did: cancel everything still
+    # pending so no dependent (or paid LLM step) starts. A step already running in a
+    # thread can't be interrupted; asyncio.run waits for it before returning.
+    done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    for t in pending:
+        t.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    # Dependents of a failed step re-raise its error, so the first one in
+    # topological order is the root cause.
+    for t in tasks.values():
+        if t in done and t.exception() is not None:
+            raise t.exception()
+
+
+def _run_pipeline_sync(company_dir: str) -> None:
     """
-    Runs: python pipeline/<step_script> <company_dir> [extra_args...]
-    Uses the current interpreter (important for venv).
+    Runs the pipeline DAG in a worker thread pool. Executed inside an EXECUTOR
+    worker, so failures are raised as plain RuntimeError (picklable) naming the step.
     """
-    script_path = PIPELINE_DIR / step_script
-    if not script_path.exists():
-        raise FileNotFoundError(f"Missing pipeline script: {script_path}")
-
-    cmd = [sys.executable, str(script_path), str(company_dir), *extra_args]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-
-    if proc.returncode != 0:
-        msg = (
-            f"Step failed: {step_script}\n"
-            f"cmd: {' '.join(cmd)}\n"
-            f"stdout:\n{proc.stdout}\n"
-            f"stderr:\n{proc.stderr}\n"
-        )
-        raise RuntimeError(msg)
+    asyncio.run(_run_pipeline_dag(company_dir))
+
 
+def _precheck_error(code: str, field: str, message: str, status_code: int = 400) -> HTTPException:
+    return HTTPException(status_code=status_code, detail={"code": code, "field": field, "message": message})
 
-def require_openai_key_for_llm_steps() -> None:
+
+def _precheck(payload: CampaignInput) -> None:
+    """
+    Validates everything the pipeline needs before any file is written or step runs,
+    so a bad request fails fast instead of after the paid LLM steps.
+    """
+    if not payload.company_name.strip():
+        raise _precheck_error("empty", "company_name", "company_name must not be empty")
+    if len({p.persona_username.strip() for p in payload.personas if p.persona_username.strip()}) < 2:
+        raise _precheck_error(
+            "too_few", "personas", "At least 2 distinct personas are needed so comments come from non-OP accounts"
+        )
+    if not any(s and s.strip() for s in payload.subreddits):
+        raise _precheck_error("empty", "subreddits", "At least one subreddit is required")
+    if not payload.keywords:
+        raise _precheck_error("empty", "keywords", "At least one keyword is required")
+    if payload.target_posts_per_week <= 0:
+        raise _precheck_error("not_positive", "target_posts_per_week", "target_posts_per_week must be greater than 0")
+
+    # LLM steps will fail without OPENAI_API_KEY; that's a server config problem, not a bad request
     if not os.getenv("OPENAI_API_KEY"):
-        raise HTTPException(
+        raise _precheck_error(
+            "missing_api_key",
+            "OPENAI_API_KEY",
+            "OPENAI_API_KEY is not set in environment. Set it before calling this endpoint.",
             status_code=500,
-            detail="OPENAI_API_KEY is not set in environment. Set it before calling this endpoint.",
         )
 
 
@@ -123,11 +254,14 @@ def root():
 async def create_campaign_v2(payload: CampaignInput):
     """
     New pipeline mode.
+    0) Precheck the payload (400 on invalid input)
     1) Save request.json in companies/<company>/
     2) Run pipeline scripts in order
     3) Return final nested json path
     """
     try:
+        _precheck(payload)
+
         company_dir = ensure_company_dir(payload.company_name)
         
         # Calculate company website
@@ -147,30 +281,14 @@ async def create_campaign_v2(payload: CampaignInput):
         write_json(company_dir / "request.json", request_obj)
         write_json(company_dir / "input_payload.json", payload.dict())
 
-        # LLM steps will fail without OPENAI_API_KEY
-        require_openai_key_for_llm_steps()
-
-        # Run your pipeline steps.
-        # Adjust this list to match the exact filenames you created.
-        # Based on our previous steps:
-        run_step("step1_cluster.py", company_dir)
-        run_step("step2_capacity.py", company_dir)
-        run_step("step3_generate_titles.py", company_dir)
-        run_step("step5_route_subreddits.py", company_dir)
-        run_step("step7_generate_bodies.py", company_dir)
-        run_step("step8_weekly_plan.py", company_dir)
-        run_step("step9_assign_schedule.py", company_dir)
-        run_step("step10_comment_plan.py", company_dir)
-        run_step("step11_generate_comments.py", company_dir)
-        run_step("step12_build_reddit_output.py", company_dir)
-        run_step("step13_build_reddit_output_nested.py", company_dir)
-
-        nested_path = company_dir / "reddit_output_nested.json"
-        if not nested_path.exists():
-            raise RuntimeError("Expected reddit_output_nested.json was not created")
+        await asyncio.get_running_loop().run_in_executor(EXECUTOR, _run_pipeline_sync, str(company_dir))
+
+        nested_path = find_nested_output(company_dir)
+        if nested_path is None:
+            raise RuntimeError("Expected reddit_output_nested.json(.gz) was not created")
 
         # Load the nested output data to return to frontend
-        nested_data = json.loads(nested_path.read_text(encoding="utf-8"))
+        nested_data = read_json_file(nested_path)
 
         return {
             "status": "success",
@@ -244,41 +362,52 @@ async def create_campaign_from_file(file: UploadFile = File(...)):
     Then run the same pipeline.
     """
     try:
-        contents = await file.read()
-
+        # Parse straight from the spooled upload; only the expected columns are kept.
         if file.filename.endswith(".csv"):
-            df = pd.read_csv(io.BytesIO(contents))
+            df = pd.read_csv(file.file, usecols=_is_upload_column)
         elif file.filename.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(io.BytesIO(contents))
+            df = pd.read_excel(file.file, usecols=_is_upload_column)
         else:
             raise HTTPException(status_code=400, detail="Unsupported format. Use CSV or Excel.")
 
         # Very simple extraction. Customize to your file layout.
-        # Expected columns:
-        # company_name, company_description, subreddit, persona_username, persona_info, keyword_id, keyword, target_posts_per_week
+        # Expected columns: see UPLOAD_COLUMNS
         cols = {c.lower().strip(): c for c in df.columns}
+        names = list(df.columns)
 
-        def col(name: str) -> str:
+        def col(name: str) -> int:
             if name not in cols:
                 raise HTTPException(status_code=400, detail=f"Missing column: {name}")
-            return cols[name]
+            return names.index(cols[name])
 
-        company_name = str(df[col("company_name")].iloc[0]).strip()
-        company_description = str(df[col("company_description")].iloc[0]).strip()
-        target_posts_per_week = int(df[col("target_posts_per_week")].iloc[0])
+        i_sr = col("subreddit")
+        i_kid, i_kw = col("keyword_id"), col("keyword")
+        i_user, i_info = col("persona_username"), col("persona_info")
 
-        subreddits = sorted(set(str(x).strip() for x in df[col("subreddit")].dropna().tolist() if str(x).strip()))
-        keywords = []
-        for _, r in df[[col("keyword_id"), col("keyword")]].dropna().iterrows():
-            keywords.append({"keyword_id": str(r[col("keyword_id")]).strip(), "keyword": str(r[col("keyword")]).strip()})
+        company_name = str(df.iat[0, col("company_name")]).strip()
+        company_description = str(df.iat[0, col("company_description")]).strip()
+        target_posts_per_week = int(df.iat[0, col("target_posts_per_week")])
 
+        # Single pass over the rows for subreddits, keywords and personas
+        subreddits_set = set()
+        keywords = []
         personas_map: Dict[str, str] = {}
-        for _, r in df[[col("persona_username"), col("persona_info")]].dropna().iterrows():
-            u = str(r[col("persona_username")]).strip()
-            info = str(r[col("persona_info")]).strip()
-            if u and info and u not in personas_map:
-                personas_map[u] = info
-
+        for row in df.itertuples(index=False, name=None):
+            sr = row[i_sr]
+            if not pd.isna(sr) and str(sr).strip():
+                subreddits_set.add(str(sr).strip())
+
+            kid, kw = row[i_kid], row[i_kw]
+            if not (pd.isna(kid) or pd.isna(kw)):
+                keywords.append({"keyword_id": str(kid).strip(), "keyword": str(kw).strip()})
+
+            u, info = row[i_user], row[i_info]
+            if not (pd.isna(u) or pd.isna(info)):
+                u, info = str(u).strip(), str(info).strip()
+                if u and info and u not in personas_map:
+                    personas_map[u] = info
+
+        subreddits = sorted(subreddits_set)
         personas = [{"persona_username": u, "info": info} for u, info in personas_map.items()]
 
         payload = CampaignInput(
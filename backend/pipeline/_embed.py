@@ -0,0 +1,144 @@
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional
+
+import numpy as np
+import orjson
+import torch
+from sentence_transformers import SentenceTransformer
+
+# EMBED_BACKEND=onnx runs the encoder through ONNX Runtime with an INT8-quantized export
+# (needs sentence-transformers[onnx] >= 3.2). EMBED_ONNX_FILE picks a different export,
+# e.g. onnx/model_quint8_avx2.onnx on CPUs without AVX-512 VNNI.
+DEFAULT_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# torch already defaults to one thread per physical core; the API runs several pipeline
+# workers side by side, so raising it by default would oversubscribe. Opt in per deployment.
+if os.getenv("TORCH_NUM_THREADS"):
+    torch.set_num_threads(int(os.environ["TORCH_NUM_THREADS"]))
+
+
+def _backend_tag() -> str:
+    if os.getenv("EMBED_BACKEND") == "onnx":
+        return "onnx:" + os.getenv("EMBED_ONNX_FILE", DEFAULT_ONNX_FILE)
+    return "torch"
+
+
+@lru_cache(maxsize=4)
+def get_model(name: str) -> SentenceTransformer:
+    """
+    Load a SentenceTransformer once per process and hand back the same instance.
+    Pipeline steps run in the same worker, so later steps reuse the warm model.
+    """
+    if os.getenv("EMBED_BACKEND") == "onnx":
+        model = SentenceTransformer(
+            name,
+            backend="onnx",
+            model_kwargs={"file_name": os.getenv("EMBED_ONNX_FILE", DEFAULT_ONNX_FILE)},
+        )
+    else:
+        model = SentenceTransformer(name)
+    model.eval()
+    return model
+
+
+def _encode(model_name: str, texts: List[str], **encode_kwargs) -> np.ndarray:
+    # inference_mode also skips autograd version counters, which no_grad keeps
+    with torch.inference_mode():
+        return np.asarray(get_model(model_name).encode(texts, **encode_kwargs))
+
+
+def _save_atomic(path: Path, save: Callable[[BinaryIO], None]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename so a concurrent run never loads a partial file
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        save(f)
+    os.replace(tmp, path)
+
+
+def encode_cached(
+    model_name: str,
+    texts: List[str],
+    cache_dir: Optional[Path] = None,
+    **encode_kwargs,
+) -> np.ndarray:
+    """
+    model.encode(texts) as a numpy array, memoised on disk under cache_dir.
+    The file name hashes the model, backend, encode options and texts, so any
+    input change simply misses the cache. cache_dir=None disables caching.
+    """
+    if cache_dir is None:
+        return _encode(model_name, texts, **encode_kwargs)
+
+    key_src = orjson.dumps(
+        [model_name, _backend_tag(), sorted(encode_kwargs.items()), texts],
+        option=orjson.OPT_NON_STR_KEYS,
+    )
+    key = hashlib.blake2b(key_src, digest_size=16).hexdigest()
+    path = Path(cache_dir) / f"emb_{key}.npy"
+
+    if path.exists():
+        return np.load(path, mmap_mode="r")
+
+    emb = _encode(model_name, texts, **encode_kwargs)
+    _save_atomic(path, lambda f: np.save(f, emb))
+    return emb
+
+
+def encode_rows_cached(
+    model_name: str,
+    texts: List[str],
+    cache_path: Optional[Path] = None,
+    **encode_kwargs,
+) -> np.ndarray:
+    """
+    Like encode_cached, but memoised per text in one npz at cache_path, so a
+    rerun only encodes texts it has not seen. Row keys hash the model, backend,
+    encode options and text. cache_path=None disables caching.
+    """
+    if cache_path is None:
+        return _encode(model_name, texts, **encode_kwargs)
+
+    prefix = orjson.dumps(
+        [model_name, _backend_tag(), sorted(encode_kwargs.items())],
+        option=orjson.OPT_NON_STR_KEYS,
+    )
+    keys = [hashlib.blake2b(prefix + b"\x00" + t.encode("utf-8"), digest_size=16).hexdigest() for t in texts]
+
+    cached_keys: List[str] = []
+    cached_emb = None
+    if cache_path.exists():
+        with np.load(cache_path) as data:
+            cached_keys, cached_emb = data["keys"].tolist(), data["emb"]
+    row_of = {k: i for i, k in enumerate(cached_keys)}
+
+    missing = {}
+    for k, t in zip(keys, texts):
+        if k not in row_of:
+            missing.setdefault(k, t)
+
+    if missing:
+        new_emb = _encode(model_name, list(missing.values()), **encode_kwargs)
+        for j, k in enumerate(missing, start=len(cached_keys)):
+            row_of[k] = j
+        cached_keys = cached_keys + list(missing)
+        cached_emb = new_emb if cached_emb is None else np.concatenate([cached_emb, new_emb])
+        _save_atomic(cache_path, lambda f: np.savez(f, keys=np.asarray(cached_keys), emb=cached_emb))
+
+    return cached_emb[[row_of[k] for k in keys]]
+
+
+def similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    float32 a @ b.T, run through cuBLAS when a CUDA device is available.
+    Inputs may be read-only memmaps from encode_cached, so they are copied
+    into fresh tensors rather than wrapped.
+    """
+    if torch.cuda.is_available():
+        ta = torch.tensor(np.asarray(a, dtype=np.float32), device="cuda")
+        tb = torch.tensor(np.asarray(b, dtype=np.float32), device="cuda")
+        return (ta @ tb.T).cpu().numpy()
+    return (np.asarray(a) @ np.asarray(b).T).astype(np.float32, copy=False)
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+import orjson
+from openai import AsyncOpenAI, RateLimitError
+from pydantic import BaseModel
+
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF_SECONDS = 1.0
+
+# Set LLM_CACHE=1 to reuse plain-text responses for identical (model, prompt) pairs across runs.
+LLM_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "llm"
+
+
+def parse_json_loose(text: str) -> Dict[str, Any]:
+    try:
+        return json.loads(text)
+    except Exception:
+        s, e = text.find("{"), text.rfind("}")
+        if s != -1 and e != -1 and e > s:
+            return json.loads(text[s : e + 1])
+        raise
+
+
+def llm_cache_enabled() -> bool:
+    return os.getenv("LLM_CACHE") == "1"
+
+
+def _llm_cache_path(model: str, prompt: str) -> Path:
+    key = hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+    return LLM_CACHE_DIR / f"{key}.json"
+
+
+def llm_cache_get(model: str, prompt: str) -> str | None:
+    path = _llm_cache_path(model, prompt)
+    if not path.exists():
+        return None
+    try:
+        return orjson.loads(path.read_bytes())["response"]
+    except Exception:
+        return None
+
+
+def llm_cache_put(model: str, prompt: str, response: str) -> None:
+    path = _llm_cache_path(model, prompt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename so concurrent workers never see a partial entry
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(orjson.dumps({"response": response, "model": model, "ts": time.time()}))
+    os.replace(tmp, path)
+
+
+async def first_model_that_answers(models: List[str], call: Callable[[str], Awaitable[Any]]) -> Any:
+    """Run call(model) over models in order, backing off and retrying on rate limits."""
+    last_err = None
+    for m in models:
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                return await call(m)
+            except RateLimitError as e:
+                # Back off and retry the same model; other errors fall through to the next model
+                last_err = e
+                if attempt < RATE_LIMIT_RETRIES:
+                    await asyncio.sleep(RATE_LIMIT_BACKOFF_SECONDS * 2**attempt)
+            except Exception as e:
+                last_err = e
+                break
+    raise last_err
+
+
+async def call_with_fallback(
+    client: AsyncOpenAI,
+    models: List[str],
+    prompt: str,
+    max_output_tokens: int,
+    temperature: Optional[float] = None,
+    use_cache: bool = False,
+) -> str:
+    """
+    Plain-text reply from the first model that answers. With use_cache, a cached
+    reply for any of the models is returned without a request.
+    """
+    if use_cache:
+        for m in models:
+            cached = llm_cache_get(m, prompt)
+            if cached is not None:
+                return cached
+
+    extra = {} if temperature is None else {"temperature": temperature}
+
+    async def _call(m: str) -> str:
+        r = await client.responses.create(model=m, input=prompt, max_output_tokens=max_output_tokens, **extra)
+        text = r.output_text.strip()
+        if use_cache:
+            llm_cache_put(m, prompt, text)
+        return text
+
+    return await first_model_that_answers(models, _call)
+
+
+async def call_structured(
+    client: AsyncOpenAI,
+    models: List[str],
+    prompt: str,
+    text_format: Type[BaseModel],
+    max_output_tokens: int,
+    temperature: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Ask for output matching text_format via structured outputs, so the reply is
+    schema-valid JSON. If no model accepts the schema, fall back to a plain
+    request whose text is scanned with parse_json_loose ({} if that fails too).
+    """
+    extra = {} if temperature is None else {"temperature": temperature}
+
+    async def _call(m: str) -> Dict[str, Any]:
+        r = await client.responses.parse(
+            model=m,
+            input=prompt,
+            text_format=text_format,
+            max_output_tokens=max_output_tokens,
+            **extra,
+        )
+        if r.output_parsed is None:
+            raise ValueError(f"{m} returned no parsed output")
+        return r.output_parsed.model_dump()
+
+    try:
+        return await first_model_that_answers(models, _call)
+    except RateLimitError:
+        raise
+    except Exception:
+        raw = await call_with_fallback(client, models, prompt, max_output_tokens, temperature)
+        try:
+            return parse_json_loose(raw)
+        except ValueError:
+            return {}
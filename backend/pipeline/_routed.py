@@ -0,0 +1,60 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import orjson
+
+# step5's routed titles: a small sidecar with meta + persona fields, and one JSON line per title
+ROUTED_META = "titles_routed.meta.json"
+ROUTED_ROWS = "titles_routed.jsonl"
+
+
+def write_routed_meta(company_dir: Path, meta: Dict[str, Any], personas: List[Dict[str, Any]]) -> Path:
+    """Sidecar with the meta block and each persona's fields (any "titles" key is dropped)."""
+    path = Path(company_dir) / ROUTED_META
+    sidecar = {
+        "meta": meta,
+        "personas": [{k: v for k, v in p.items() if k != "titles"} for p in personas],
+    }
+    path.write_bytes(orjson.dumps(sidecar, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    return path
+
+
+def write_routed_rows(company_dir: Path, rows: Iterable[Tuple[int, Dict[str, Any]]]) -> Path:
+    """
+    Write (persona_index, title) rows as they are produced, so a generator of rows is
+    never held in memory. Rows must come in persona order.
+    """
+    rows_path = Path(company_dir) / ROUTED_ROWS
+    with open(rows_path, "wb") as f:
+        for p_idx, t in rows:
+            f.write(orjson.dumps({"p_idx": p_idx, "title": t}, option=orjson.OPT_NON_STR_KEYS))
+            f.write(b"\n")
+    return rows_path
+
+
+def read_routed_meta(company_dir: Path) -> Dict[str, Any]:
+    path = Path(company_dir) / ROUTED_META
+    if not path.exists():
+        raise FileNotFoundError(f"Missing file: {path}")
+    return orjson.loads(path.read_bytes())
+
+
+def iter_routed_rows(company_dir: Path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (persona_index, title) in file order, which is persona order."""
+    path = Path(company_dir) / ROUTED_ROWS
+    if not path.exists():
+        raise FileNotFoundError(f"Missing file: {path}")
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                row = orjson.loads(line)
+                yield row["p_idx"], row["title"]
+
+
+def read_routed(company_dir: Path) -> Dict[str, Any]:
+    """Reassemble the nested {"meta", "personas": [{..., "titles": [...]}]} payload."""
+    meta = read_routed_meta(company_dir)
+    personas = [{**p, "titles": []} for p in meta.get("personas", [])]
+    for p_idx, t in iter_routed_rows(company_dir):
+        personas[p_idx]["titles"].append(t)
+    return {"meta": meta.get("meta", {}), "personas": personas}
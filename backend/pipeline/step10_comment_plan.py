@@ -1,24 +1,31 @@
-import json
 import sys
 from pathlib import Path
 from datetime import datetime, timedelta
-import hashlib
+import zlib
+
+import orjson
 
 COMMENTS_PER_POST = 3
 
+# Parent of each of the 3 comments per post ("c1" = reply to the first comment).
+# Picked by hash: standalone/reply/standalone, all standalone, standalone/standalone/reply.
+PARENT_PATTERNS = (("", "c1", ""), ("", "", ""), ("", "", "c1"))
+
 
 def read_json(p: Path):
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
-def write_json(p: Path, obj):
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+def write_json_compact(p: Path, obj):
+    # Intermediates here are only read back by later steps, so skip pretty-printing
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
 
 
 def _stable_hash_int(s: str) -> int:
-    return int(hashlib.sha256(s.encode("utf-8")).hexdigest()[:12], 16)
+    # Only used to pick commenters/offsets deterministically; no need for a crypto hash
+    return zlib.crc32(s.encode("utf-8")) & 0xFFFFFFFF
 
 
 def parse_iso(dt_str: str) -> datetime:
@@ -26,7 +33,8 @@ def parse_iso(dt_str: str) -> datetime:
 
 
 def fmt_dt(dt: datetime) -> str:
-    return dt.strftime("%Y-%m-%d %H:%M")
+    # Same as strftime("%Y-%m-%d %H:%M") without the per-call format parsing
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}"
 
 
 def pick_commenters(all_usernames, op_username, n_unique=3, seed=""):
@@ -65,11 +73,14 @@ def schedule_comment_times(post_time: datetime, n_comments: int, seed: str):
 
 
 def flatten_scheduled_posts(scheduled_plan):
+    """Flatten weeks into one time-ordered list and assign each post its P{i} id."""
     flat = []
     for w in scheduled_plan:
         for p in w.get("posts", []):
             flat.append(p)
     flat.sort(key=lambda x: x["scheduled_at"])
+    for i, post in enumerate(flat, start=1):
+        post["post_id"] = f"P{i}"
     return flat
 
 
@@ -84,12 +95,14 @@ def main(company_dir: str):
         raise ValueError("Need at least 2 personas total to create non-OP comments")
 
     flat_posts = flatten_scheduled_posts(scheduled_plan)
+    # step11/step12 read this instead of re-flattening scheduled_plan.json
+    write_json_compact(p / "scheduled_plan_flat.json", flat_posts)
 
     comment_plan = []
     c_counter = 1
 
-    for i, post in enumerate(flat_posts, start=1):
-        post_id = f"P{i}"
+    for post in flat_posts:
+        post_id = post["post_id"]
         op = post.get("persona_username", "")
         title = post.get("title", "")
         subreddit = post.get("subreddit", "")
@@ -99,104 +112,27 @@ def main(company_dir: str):
         commenters = pick_commenters(all_usernames, op, n_unique=3, seed=seed)
         times = schedule_comment_times(post_time, COMMENTS_PER_POST, seed=seed)
 
-        c1 = f"C{c_counter}"; c_counter += 1
-        c2 = f"C{c_counter}"; c_counter += 1
-        c3 = f"C{c_counter}"; c_counter += 1
+        ids = [f"C{c_counter + k}" for k in range(COMMENTS_PER_POST)]
+        c_counter += COMMENTS_PER_POST
 
         # Decide structure based on hash: mix of standalone and threaded comments
         h = _stable_hash_int(seed + "|structure")
-        structure_choice = h % 3
+        pattern = PARENT_PATTERNS[h % len(PARENT_PATTERNS)]
+        parents = [ids[0] if parent == "c1" else "" for parent in pattern]
 
-        if structure_choice == 0:
-            # Pattern: standalone, reply to first, standalone
-            comment_plan.append({
-                "comment_id": c1,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[0],
-                "timestamp": fmt_dt(times[0]),
-                "title": title,
-                "subreddit": subreddit
-            })
-            comment_plan.append({
-                "comment_id": c2,
-                "post_id": post_id,
-                "parent_comment_id": c1,
-                "username": commenters[1],
-                "timestamp": fmt_dt(times[1]),
-                "title": title,
-                "subreddit": subreddit
-            })
-            comment_plan.append({
-                "comment_id": c3,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[2],
-                "timestamp": fmt_dt(times[2]),
-                "title": title,
-                "subreddit": subreddit
-            })
-        elif structure_choice == 1:
-            # Pattern: all standalone comments
-            comment_plan.append({
-                "comment_id": c1,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[0],
-                "timestamp": fmt_dt(times[0]),
-                "title": title,
-                "subreddit": subreddit
-            })
-            comment_plan.append({
-                "comment_id": c2,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[1],
-                "timestamp": fmt_dt(times[1]),
-                "title": title,
-                "subreddit": subreddit
-            })
-            comment_plan.append({
-                "comment_id": c3,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[2],
-                "timestamp": fmt_dt(times[2]),
-                "title": title,
-                "subreddit": subreddit
-            })
-        else:
-            # Pattern: standalone, standalone, reply to first
-            comment_plan.append({
-                "comment_id": c1,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[0],
-                "timestamp": fmt_dt(times[0]),
-                "title": title,
-                "subreddit": subreddit
-            })
-            comment_plan.append({
-                "comment_id": c2,
-                "post_id": post_id,
-                "parent_comment_id": "",
-                "username": commenters[1],
-                "timestamp": fmt_dt(times[1]),
-                "title": title,
-                "subreddit": subreddit
-            })
+        for cid, parent, user, t in zip(ids, parents, commenters, times):
             comment_plan.append({
-                "comment_id": c3,
+                "comment_id": cid,
                 "post_id": post_id,
-                "parent_comment_id": c1,
-                "username": commenters[2],
-                "timestamp": fmt_dt(times[2]),
+                "parent_comment_id": parent,
+                "username": user,
+                "timestamp": fmt_dt(t),
                 "title": title,
                 "subreddit": subreddit
             })
 
     out_path = p / "comment_plan.json"
-    write_json(out_path, comment_plan)
+    write_json_compact(out_path, comment_plan)
 
 
 if __name__ == "__main__":
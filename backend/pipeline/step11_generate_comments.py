@@ -1,87 +1,87 @@
-import json
+import asyncio
 import os
-import re
 import sys
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List
 
-from openai import OpenAI
+import httpx
+import orjson
+from openai import AsyncOpenAI
+
+try:
+    from pipeline._llm import call_with_fallback, llm_cache_enabled, parse_json_loose
+except ImportError:
+    from _llm import call_with_fallback, llm_cache_enabled, parse_json_loose
 
 MODEL_CANDIDATES = ["gpt-4o-mini", "gpt-4.1-mini"]
 MAX_WORDS = 9
+MAX_CONCURRENT_REQUESTS = 16
+POSTS_PER_BATCH = 6
+MAX_OUTPUT_TOKENS_PER_POST = 160
+TEMPERATURE = 0.4
+DEFAULT_COMMENTS = ["Following this thread.", "Same question here.", "Thanks for sharing."]
 
+# Pooled HTTP/2 keep-alive connections shared by every request in this process
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+HTTP_TIMEOUT = 30.0
 
-def read_json(p: Path) -> Any:
-    if not p.exists():
-        raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
 
+_LOOP: asyncio.AbstractEventLoop | None = None
+_CLIENT: AsyncOpenAI | None = None
 
-def write_json(p: Path, obj: Any) -> None:
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
 
+def get_client() -> AsyncOpenAI:
+    """Lazily build the process-wide AsyncOpenAI client (must be called on _LOOP)."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = AsyncOpenAI(
+            http_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+    return _CLIENT
 
-def parse_json_loose(text: str) -> Dict[str, Any]:
-    try:
-        return json.loads(text)
-    except Exception:
-        s, e = text.find("{"), text.rfind("}")
-        if s != -1 and e != -1 and e > s:
-            return json.loads(text[s : e + 1])
-        raise
 
+def run_async(coro):
+    """
+    Run coro on a per-process event loop that outlives main().
+    httpx connections belong to the loop that opened them, so reusing the loop
+    lets back-to-back campaigns in the same worker share the pooled client.
+    """
+    global _LOOP, _CLIENT
+    if _LOOP is None or _LOOP.is_closed():
+        _LOOP = asyncio.new_event_loop()
+        _CLIENT = None
+    return _LOOP.run_until_complete(coro)
 
-def cap_words(s: str, max_words: int = MAX_WORDS) -> str:
-    words = [w for w in re.split(r"\s+", (s or "").strip()) if w]
-    return " ".join(words[:max_words])
 
+def read_json(p: Path) -> Any:
+    if not p.exists():
+        raise FileNotFoundError(f"Missing file: {p}")
+    return orjson.loads(p.read_bytes())
 
-def call_with_fallback(client: OpenAI, prompt: str) -> str:
-    last_err = None
-    for m in MODEL_CANDIDATES:
-        try:
-            r = client.responses.create(
-                model=m,
-                input=prompt,
-                max_output_tokens=160,
-                temperature=0.4,
-            )
-            return r.output_text.strip()
-        except Exception as e:
-            last_err = e
-    raise last_err
 
+def write_json(p: Path, obj: Any) -> None:
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
-def flatten_scheduled_posts(scheduled_plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    flat = []
-    for w in scheduled_plan:
-        for p in w.get("posts", []):
-            flat.append(p)
-    flat.sort(key=lambda x: x.get("scheduled_at", ""))
-    return flat
 
+def cap_words(s: str, max_words: int = MAX_WORDS) -> str:
+    return " ".join((s or "").split()[:max_words])
 
-def build_post_comments_prompt(
-    title: str,
-    subreddit: str,
-    company_name: str,
-    company_description: str,
-) -> str:
-    sr = (subreddit or "").strip()
-    sr = sr[2:] if sr.lower().startswith("r/") else sr
 
+def build_comments_prompt_prefix(company_name: str, company_description: str) -> str:
+    """
+    Static part of the comments prompt, identical for every post in a campaign.
+    Kept first so the server-side prompt cache can reuse it across requests.
+    """
     return f"""
-Generate authentic, organic Reddit comments for a post.
+Generate authentic, organic Reddit comments for the Reddit post(s) below.
 
-Context:
-- Subreddit: r/{sr}
-- Post Title: {title}
+Company context:
 - Company: {company_name}
 - Company Info: {company_description}
 
 Requirements:
-1. Generate exactly 3 distinct comments
+1. Generate exactly 3 distinct comments per post
 2. Each comment MUST be <= {MAX_WORDS} words
 3. Sound like real Reddit users, natural, casual
 4. Subtly positive about {company_name}, no hard selling
@@ -89,55 +89,159 @@ Requirements:
 6. No emojis, no marketing language
 7. Relevant to the post title
 
+""".lstrip()
+
+
+def _subreddit_name(subreddit: str) -> str:
+    sr = (subreddit or "").strip()
+    return sr[2:] if sr.lower().startswith("r/") else sr
+
+
+def build_post_comments_prompt(prefix: str, title: str, subreddit: str) -> str:
+    return prefix + f"""Post:
+- Subreddit: r/{_subreddit_name(subreddit)}
+- Post Title: {title}
+
 Return ONLY valid JSON:
-{{"comments":["comment 1","comment 2","comment 3"]}}
-""".strip()
+{{"comments":["comment 1","comment 2","comment 3"]}}"""
+
+
+def build_batch_prompt(prefix: str, posts_batch: List[Dict[str, Any]]) -> str:
+    """One prompt for several posts; the model answers with one entry per post index."""
+    blocks = []
+    for i, post in enumerate(posts_batch, start=1):
+        blocks.append(
+            f"Post {i}:\n"
+            f"- Subreddit: r/{_subreddit_name(post.get('subreddit', ''))}\n"
+            f"- Post Title: {post.get('title', '')}"
+        )
+    posts_text = "\n\n".join(blocks)
+
+    return prefix + f"""{posts_text}
+
+Return ONLY valid JSON with exactly {len(posts_batch)} entries, one per post index:
+{{"posts":[{{"index":1,"comments":["comment 1","comment 2","comment 3"]}}]}}"""
+
+
+def parse_batch_comments(raw: str, n_posts: int) -> Dict[int, List[str]]:
+    """Map 1-based post index -> comments for every well-formed entry in a batch reply."""
+    try:
+        entries = parse_json_loose(raw).get("posts", [])
+    except Exception:
+        return {}
+    if not isinstance(entries, list):
+        return {}
+
+    by_index: Dict[int, List[str]] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            idx = int(entry.get("index"))
+        except (TypeError, ValueError):
+            continue
+        comments = entry.get("comments")
+        if 1 <= idx <= n_posts and isinstance(comments, list) and len(comments) >= 3:
+            by_index[idx] = comments
+    return by_index
+
+
+def finalize_comments(comments: Any) -> List[str]:
+    if not isinstance(comments, list) or len(comments) < 3:
+        comments = DEFAULT_COMMENTS
+    return [cap_words(c, MAX_WORDS) for c in comments[:3]]
+
+
+async def generate_post_comments(
+    post_ids: List[str],
+    posts_by_id: Dict[str, Dict[str, Any]],
+    company_name: str,
+    company_description: str,
+) -> Dict[str, List[str]]:
+    """
+    Fetch the 3 comment texts for every post, keyed by post_id.
+    Posts are sent POSTS_PER_BATCH at a time and batches run concurrently;
+    any post missing from a batch reply is retried with its own prompt.
+    """
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    prefix = build_comments_prompt_prefix(company_name, company_description)
+
+    client = get_client()
+    # LLM_CACHE=1 reuses replies for identical (model, prompt) pairs across runs
+    use_cache = llm_cache_enabled()
+
+    async def _gen_one(post: Dict[str, Any]) -> List[str]:
+        prompt = build_post_comments_prompt(prefix, post.get("title", ""), post.get("subreddit", ""))
+
+        async with sem:
+            raw = await call_with_fallback(
+                client, MODEL_CANDIDATES, prompt, MAX_OUTPUT_TOKENS_PER_POST, TEMPERATURE, use_cache
+            )
+        return finalize_comments(parse_json_loose(raw).get("comments", []))
+
+    async def _gen_batch(batch_ids: List[str]) -> List[List[str]]:
+        posts = [posts_by_id.get(post_id, {}) for post_id in batch_ids]
+        if len(posts) == 1:
+            return [await _gen_one(posts[0])]
+
+        prompt = build_batch_prompt(prefix, posts)
+        async with sem:
+            raw = await call_with_fallback(
+                client, MODEL_CANDIDATES, prompt, MAX_OUTPUT_TOKENS_PER_POST * len(posts), TEMPERATURE, use_cache
+            )
+        by_index = parse_batch_comments(raw, len(posts))
+
+        missing = [i for i in range(1, len(posts) + 1) if i not in by_index]
+        retried = await asyncio.gather(*(_gen_one(posts[i - 1]) for i in missing))
+
+        results = {i: finalize_comments(c) for i, c in by_index.items()}
+        results.update(zip(missing, retried))
+        return [results[i] for i in range(1, len(posts) + 1)]
+
+    batches = [post_ids[i : i + POSTS_PER_BATCH] for i in range(0, len(post_ids), POSTS_PER_BATCH)]
+    tasks = [asyncio.create_task(_gen_batch(batch)) for batch in batches]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    comments_by_post: Dict[str, List[str]] = {}
+    for batch, r in zip(batches, results):
+        if isinstance(r, BaseException):
+            raise r
+        comments_by_post.update(zip(batch, r))
+    return comments_by_post
 
 
 def main(company_dir: str, max_posts: int | None = None):
     p = Path(company_dir)
 
     request = read_json(p / "request.json")
-    scheduled_plan = read_json(p / "scheduled_plan.json")
+    flat_posts = read_json(p / "scheduled_plan_flat.json")
     comment_plan = read_json(p / "comment_plan.json")
 
     if not os.getenv("OPENAI_API_KEY"):
         raise EnvironmentError("OPENAI_API_KEY is not set in environment")
 
-    client = OpenAI()
-
     company_name = request["company"]["name"]
     company_description = request["company"]["description"]
 
-    flat_posts = flatten_scheduled_posts(scheduled_plan)
-
-    post_meta: Dict[str, Tuple[str, str]] = {}
-    for i, post in enumerate(flat_posts, start=1):
-        post_id = f"P{i}"
-        post_meta[post_id] = (post.get("title", ""), post.get("subreddit", ""))
+    posts_by_id = {post["post_id"]: post for post in flat_posts}
 
     rows_by_post = defaultdict(list)
     for r in comment_plan:
         rows_by_post[r["post_id"]].append(r)
 
-    post_ids = sorted(set(r["post_id"] for r in comment_plan), key=lambda x: int(x[1:]))
+    # comment_plan is emitted in post order, so dict insertion order is already P1, P2, ...
+    post_ids = list(rows_by_post.keys())
     if max_posts is not None:
         post_ids = post_ids[:max_posts]
 
+    comments_by_post = run_async(
+        generate_post_comments(post_ids, posts_by_id, company_name, company_description)
+    )
+
     comment_rows = []
 
     for post_id in post_ids:
-        title, subreddit = post_meta.get(post_id, ("", ""))
-        prompt = build_post_comments_prompt(title, subreddit, company_name, company_description)
-
-        raw = call_with_fallback(client, prompt)
-        obj = parse_json_loose(raw)
-        comments = obj.get("comments", [])
-
-        if not isinstance(comments, list) or len(comments) < 3:
-            comments = ["Following this thread.", "Same question here.", "Thanks for sharing."]
-
-        comments = [cap_words(c, MAX_WORDS) for c in comments[:3]]
+        comments = comments_by_post[post_id]
 
         planned = rows_by_post[post_id]
         planned.sort(key=lambda x: x["timestamp"])
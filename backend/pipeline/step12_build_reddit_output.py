@@ -1,49 +1,42 @@
-import json
 import sys
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Any, Dict, List
 
-import pandas as pd
+import orjson
 
 
 POSTS_COLS = ["post_id", "subreddit", "title", "body", "author_username", "timestamp", "keyword_ids"]
 COMMENTS_COLS = ["comment_id", "post_id", "parent_comment_id", "comment_text", "username", "timestamp", "Column 7"]
 
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def read_json(p: Path) -> Any:
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
-def enforce_cols(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
-    for c in cols:
-        if c not in df.columns:
-            df[c] = ""
-    return df[cols]
+def write_json_compact(p: Path, obj: Any) -> None:
+    # reddit_output.json is only read back by step13, so skip pretty-printing
+    with open(p, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
 
 
-def flatten_scheduled_posts(scheduled_plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    flat = []
-    for w in scheduled_plan:
-        for p in w.get("posts", []):
-            flat.append(p)
-    flat.sort(key=lambda x: x.get("scheduled_at", ""))
-    return flat
+def normalize_row(row: Dict[str, Any], cols: List[str]) -> Dict[str, Any]:
+    """Project row onto cols (in order), filling missing/empty values with ""."""
+    return {c: (row.get(c) or "") for c in cols}
 
 
 def main(company_dir: str):
     p = Path(company_dir)
 
-    scheduled_plan = read_json(p / "scheduled_plan.json")
+    flat_posts = read_json(p / "scheduled_plan_flat.json")
     comments_with_text = read_json(p / "comments_with_text.json")
 
-    # Build posts_rows
+    # Build posts_rows (already in POSTS_COLS order with "" defaults)
     posts_rows: List[Dict[str, Any]] = []
-    flat_posts = flatten_scheduled_posts(scheduled_plan)
-
-    pid = 1
     for post in flat_posts:
         kid = post.get("keyword_ids", [])
         if isinstance(kid, list):
@@ -53,7 +46,7 @@ def main(company_dir: str):
 
         posts_rows.append(
             {
-                "post_id": f"P{pid}",
+                "post_id": post["post_id"],
                 "subreddit": post.get("subreddit") or post.get("subreddit_assigned") or "",
                 "title": post.get("title", "") or "",
                 "body": post.get("body", "") or "",
@@ -62,41 +55,21 @@ def main(company_dir: str):
                 "keyword_ids": kid_val,
             }
         )
-        pid += 1
-
-    # Build comments_rows (normalize)
-    comments_rows: List[Dict[str, Any]] = []
-    for c in comments_with_text:
-        comments_rows.append(
-            {
-                "comment_id": c.get("comment_id", "") or "",
-                "post_id": c.get("post_id", "") or "",
-                "parent_comment_id": c.get("parent_comment_id", "") or "",
-                "comment_text": c.get("comment_text", "") or "",
-                "username": c.get("username", "") or "",
-                "timestamp": c.get("timestamp", "") or "",
-                "Column 7": c.get("Column 7", "") or "",
-            }
-        )
-
-    posts_df = pd.DataFrame(posts_rows)
-    comments_df = pd.DataFrame(comments_rows)
 
-    posts_df = enforce_cols(posts_df, POSTS_COLS).fillna("")
-    comments_df = enforce_cols(comments_df, COMMENTS_COLS).fillna("")
+    comments_rows = [normalize_row(c, COMMENTS_COLS) for c in comments_with_text]
 
     payload = {
-        "posts": posts_df.to_dict(orient="records"),
-        "comments": comments_df.to_dict(orient="records"),
+        "posts": posts_rows,
+        "comments": comments_rows,
         "meta": {
             "generated_at": datetime.now(timezone.utc).isoformat(),
-            "counts": {"posts": int(len(posts_df)), "comments": int(len(comments_df))},
+            "counts": {"posts": len(posts_rows), "comments": len(comments_rows)},
             "schema": {"posts_cols": POSTS_COLS, "comments_cols": COMMENTS_COLS},
         },
     }
 
     out_path = p / "reddit_output.json"
-    out_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_compact(out_path, payload)
 
 
 if __name__ == "__main__":
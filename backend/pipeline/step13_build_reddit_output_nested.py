@@ -1,18 +1,28 @@
-import json
+import gzip
 import sys
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Any, Dict, List
 
+import orjson
+
+GZIP_LEVEL = 1
+
 
 def read_json(p: Path) -> Any:
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
-def write_json(p: Path, obj: Any) -> None:
-    p.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+def write_json_gz(p: Path, obj: Any) -> Path:
+    """Write obj as gzip-compressed JSON to <p>.gz and return that path."""
+    gz_path = p.with_suffix(p.suffix + ".gz")
+    # Level 1: most of the size win (titles/usernames repeat a lot) for very little CPU
+    with gzip.open(gz_path, "wb", compresslevel=GZIP_LEVEL) as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
+    return gz_path
 
 
 def main(company_dir: str):
@@ -25,50 +35,33 @@ def main(company_dir: str):
     comments: List[Dict[str, Any]] = flat.get("comments", [])
     meta: Dict[str, Any] = flat.get("meta", {})
 
-    # Group comments by post_id
-    by_post: Dict[str, List[Dict[str, Any]]] = {}
+    # Sort once so each post's group comes out ordered by timestamp, then comment_id
+    comments.sort(key=lambda c: (c.get("post_id", ""), c.get("timestamp", ""), c.get("comment_id", "")))
+
+    # Group comments by post_id. step12 already normalized every row to COMMENTS_COLS,
+    # so the decoded dicts are reused as-is.
+    by_post: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
     for c in comments:
-        pid = c.get("post_id", "")
-        if pid not in by_post:
-            by_post[pid] = []
-        by_post[pid].append(
-            {
-                "comment_id": c.get("comment_id", ""),
-                "post_id": c.get("post_id", ""),
-                "parent_comment_id": c.get("parent_comment_id", ""),
-                "comment_text": c.get("comment_text", ""),
-                "username": c.get("username", ""),
-                "timestamp": c.get("timestamp", ""),
-                "Column 7": c.get("Column 7", ""),
-            }
-        )
-
-    # Ensure stable ordering: timestamp, then comment_id
-    for pid in by_post:
-        by_post[pid].sort(key=lambda x: (x.get("timestamp", ""), x.get("comment_id", "")))
-
-    # Attach comments to each post
-    nested_posts: List[Dict[str, Any]] = []
+        by_post[c.get("post_id", "")].append(c)
+
+    # Attach comments to each post (in place: the decoded payload is discarded after writing)
     for post in posts:
-        pid = post.get("post_id", "")
-        new_post = dict(post)
-        new_post["comments"] = by_post.get(pid, [])
-        nested_posts.append(new_post)
+        post["comments"] = by_post.get(post.get("post_id", ""), [])
 
     out = {
-        "posts": nested_posts,
+        "posts": posts,
         "meta": {
             **meta,
             "generated_at": datetime.now(timezone.utc).isoformat(),
             "counts": {
-                "posts": int(len(nested_posts)),
+                "posts": int(len(posts)),
                 "comments": int(len(comments)),
             },
         },
     }
 
-    out_path = p / "reddit_output_nested.json"
-    write_json(out_path, out)
+    # The API returns this payload in-memory; only the on-disk copy is compressed
+    write_json_gz(p / "reddit_output_nested.json", out)
 
 
 if __name__ == "__main__":
@@ -1,27 +1,39 @@
-import json
 import sys
 from pathlib import Path
-from collections import defaultdict
 
-from sentence_transformers import SentenceTransformer
+import numpy as np
+import orjson
 from sklearn.cluster import MiniBatchKMeans
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+try:
+    from pipeline._embed import encode_cached
+except ImportError:
+    from _embed import encode_cached
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+FAISS_MIN_POINTS_PER_CENTROID = 39
+
 
 def load_company_inputs(company_dir: str) -> dict:
     p = Path(company_dir)
     inputs_path = p / "input_payload.json"
     if not inputs_path.exists():
         raise FileNotFoundError(f"inputs.json not found at: {inputs_path}")
-    return json.loads(inputs_path.read_text(encoding="utf-8"))
+    return orjson.loads(inputs_path.read_bytes())
 
 
-def embed_queries(queries, model_name="all-MiniLM-L6-v2"):
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(
+def embed_queries(queries, model_name="all-MiniLM-L6-v2", cache_dir=None):
+    embeddings = encode_cached(
+        model_name,
         queries,
-        batch_size=64,
-        show_progress_bar=True,
+        cache_dir,
+        batch_size=128,
+        show_progress_bar=False,
         normalize_embeddings=True,
     )
     return embeddings
@@ -31,12 +43,18 @@ def choose_num_clusters(n_queries, min_clusters=4, max_clusters=20, target_clust
     if n_queries <= 0:
         return 0
     estimated = max(1, n_queries // target_cluster_size)
-    k = max(min_clusters, min(max_clusters, estimated))
-    k = min(k, n_queries)
-    return k
+    return min(max(min_clusters, min(max_clusters, estimated)), n_queries)
 
 
 def cluster_queries(embeddings, n_clusters, random_state=42):
+    # faiss k-means needs ~39 points per centroid to train cleanly; smaller inputs stay on sklearn
+    if faiss is not None and len(embeddings) >= FAISS_MIN_POINTS_PER_CENTROID * n_clusters:
+        x = np.ascontiguousarray(embeddings, dtype=np.float32)
+        kmeans = faiss.Kmeans(x.shape[1], n_clusters, niter=20, seed=random_state, verbose=False)
+        kmeans.train(x)
+        _, labels = kmeans.index.search(x, 1)
+        return labels.ravel()
+
     kmeans = MiniBatchKMeans(
         n_clusters=n_clusters,
         random_state=random_state,
@@ -47,22 +65,49 @@ def cluster_queries(embeddings, n_clusters, random_state=42):
     return labels
 
 
-def extract_cluster_keywords(queries, labels, top_n=5):
-    cluster_to_texts = defaultdict(list)
-    for q, label in zip(queries, labels):
-        cluster_to_texts[label].append(q)
+def group_by_label(labels):
+    """
+    [(label, row_indices)] for every non-empty cluster in label order.
+    One stable argsort, then each cluster is a contiguous slice; rows keep input order.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    if labels.size == 0:
+        return []
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    bounds = np.searchsorted(sorted_labels, np.arange(sorted_labels[-1] + 2)).tolist()
+    return [
+        (label, order[lo:hi])
+        for label, (lo, hi) in enumerate(zip(bounds, bounds[1:]))
+        if hi > lo
+    ]
+
+
+def extract_cluster_keywords(queries, labels, top_n=5, embeddings=None):
+    # One vocabulary/IDF fit over every query; clusters are row slices of the same matrix.
+    # With embeddings, each member's TF-IDF row is weighted by its cosine to the cluster
+    # centroid, so queries at the heart of a cluster drive its keywords.
+    vectorizer = TfidfVectorizer(
+        stop_words="english",
+        ngram_range=(1, 2),
+        max_features=1000,
+    )
+    X = vectorizer.fit_transform(queries)
+    feature_names = vectorizer.get_feature_names_out()
+    top_n = min(top_n, len(feature_names))
 
     cluster_keywords = {}
-    for label, texts in cluster_to_texts.items():
-        vectorizer = TfidfVectorizer(
-            stop_words="english",
-            ngram_range=(1, 2),
-            max_features=1000,
-        )
-        X = vectorizer.fit_transform(texts)
-        mean_tfidf = X.mean(axis=0).A1
-        feature_names = vectorizer.get_feature_names_out()
-        top_idx = mean_tfidf.argsort()[::-1][:top_n]
+    for label, rows in group_by_label(labels):
+        if embeddings is None:
+            mean_tfidf = X[rows].mean(axis=0).A1
+        else:
+            member_emb = np.asarray(embeddings[rows], dtype=np.float32)
+            weights = np.clip(member_emb @ member_emb.mean(axis=0), 0.0, None)
+            if weights.sum() <= 0:
+                weights = np.ones(len(rows), dtype=np.float32)
+            mean_tfidf = np.asarray(X[rows].T @ weights).ravel() / weights.sum()
+        top_idx = np.argpartition(-mean_tfidf, top_n - 1)[:top_n]
+        top_idx = top_idx[np.argsort(-mean_tfidf[top_idx], kind="stable")]
         cluster_keywords[label] = [feature_names[i] for i in top_idx]
     return cluster_keywords
 
@@ -86,7 +131,7 @@ def main(company_dir: str):
 
     print(f"Total queries: {len(queries)}")
 
-    embeddings = embed_queries(queries)
+    embeddings = embed_queries(queries, cache_dir=Path(company_dir) / ".cache")
 
     k = choose_num_clusters(
         n_queries=len(queries),
@@ -98,21 +143,18 @@ def main(company_dir: str):
 
     labels = cluster_queries(embeddings, n_clusters=k)
 
-    cluster_items = defaultdict(list)
-    for kid, q, label in zip(keyword_ids, queries, labels):
-        cluster_items[int(label)].append({"keyword_id": kid, "keyword": q})
-
-    cluster_keywords = extract_cluster_keywords(queries, labels, top_n=5)
+    cluster_keywords = extract_cluster_keywords(queries, labels, top_n=5, embeddings=embeddings)
     theme_names = build_theme_names(cluster_keywords)
 
     result = {"k": int(k), "clusters": []}
 
-    for label in sorted(cluster_items.keys()):
-        items = cluster_items[label]
-        ids = [x["keyword_id"] for x in items]
+    for label, rows in group_by_label(labels):
+        rows = rows.tolist()
+        ids = [keyword_ids[i] for i in rows]
+        items = [{"keyword_id": keyword_ids[i], "keyword": queries[i]} for i in rows]
         result["clusters"].append(
             {
-                "cluster_id": int(label),
+                "cluster_id": label,
                 "theme": theme_names.get(label, f"Theme {label}"),
                 "keywords": cluster_keywords.get(label, []),
                 "ids": ids,
@@ -129,7 +171,7 @@ def main(company_dir: str):
             print(f"   - {it['keyword_id']}: {it['keyword']}")
 
     out_path = Path(company_dir) / "clusters.json"
-    out_path.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    out_path.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     print(f"\nWrote: {out_path}")
 
 
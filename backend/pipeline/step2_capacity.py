@@ -1,8 +1,11 @@
-import json
 import sys
 from pathlib import Path
 from typing import Any, Dict
 
+import orjson
+
+CAPACITY_NAMES = ("persona_capacity", "subreddit_capacity", "pair_capacity")
+
 
 def load_request_or_build(company_dir: str) -> Dict[str, Any]:
     p = Path(company_dir)
@@ -10,14 +13,14 @@ def load_request_or_build(company_dir: str) -> Dict[str, Any]:
     # 1) If request.json exists, use it
     request_path = p / "request.json"
     if request_path.exists():
-        return json.loads(request_path.read_text(encoding="utf-8"))
+        return orjson.loads(request_path.read_bytes())
 
     # 2) Else build request from inputs.json (same structure as step0)
     inputs_path = p / "input_payload.json"
     if not inputs_path.exists():
         raise FileNotFoundError(f"inputs.json not found at: {inputs_path}")
 
-    data = json.loads(inputs_path.read_text(encoding="utf-8"))
+    data = orjson.loads(inputs_path.read_bytes())
 
     company_name = (data.get("company_name") or "").strip()
     company_description = (data.get("company_description") or "").strip()
@@ -52,16 +55,11 @@ def compute_capacity_from_request(
     subreddit_capacity = S * B
     pair_capacity = P * S * C
 
-    max_posts_raw = min(persona_capacity, subreddit_capacity, pair_capacity)
+    caps = (persona_capacity, subreddit_capacity, pair_capacity)
+    max_posts_raw = min(caps)
     max_posts_safe = int(max_posts_raw * safety)
 
-    limiting = []
-    if max_posts_raw == persona_capacity:
-        limiting.append("persona_capacity")
-    if max_posts_raw == subreddit_capacity:
-        limiting.append("subreddit_capacity")
-    if max_posts_raw == pair_capacity:
-        limiting.append("pair_capacity")
+    limiting = [name for name, cap in zip(CAPACITY_NAMES, caps) if cap == max_posts_raw]
 
     feasible_posts = min(target, max_posts_safe)
 
@@ -111,7 +109,7 @@ def main(company_dir: str):
     print("target_was_capped:", capacity["final"]["target_was_capped"])
 
     out_path = Path(company_dir) / "capacity.json"
-    out_path.write_text(json.dumps(capacity, indent=2, ensure_ascii=False), encoding="utf-8")
+    out_path.write_bytes(orjson.dumps(capacity, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     print(f"\nWrote: {out_path}")
 
 
@@ -1,21 +1,44 @@
-import json
+import asyncio
 import os
 import sys
 from pathlib import Path
-from typing import Dict, Any, List
-from openai import OpenAI
+from typing import Any, Dict, List
+
+import orjson
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+try:
+    from pipeline._llm import call_structured
+except ImportError:
+    from _llm import call_structured
 
 MODEL_CANDIDATES = ["gpt-4.1-mini", "gpt-4o-mini", "gpt-4.1", "gpt-4o"]
+MAX_CONCURRENT_REQUESTS = 8
+MAX_OUTPUT_TOKENS = 800
+
+
+class TitleItem(BaseModel):
+    index_in_persona: int
+    subreddit: str
+    cluster_id: int
+    keyword_ids: List[str]
+    title: str
+
+
+class PersonaTitles(BaseModel):
+    arc_label: str
+    items: List[TitleItem]
 
 
 def read_json(p: Path) -> Dict[str, Any]:
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
 def write_json(p: Path, obj: Dict[str, Any]) -> None:
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 
 def build_cluster_catalog(result: Dict[str, Any], max_clusters: int = 12) -> str:
@@ -45,16 +68,6 @@ def cluster_hints(result: Dict[str, Any], max_clusters: int = 6) -> str:
     return "\n".join(chunks) if chunks else "- edge ai\n- on device llm\n- offline assistant\n- privacy\n- latency"
 
 
-def parse_json_loose(text: str) -> Dict[str, Any]:
-    try:
-        return json.loads(text)
-    except Exception:
-        s, e = text.find("{"), text.rfind("}")
-        if s != -1 and e != -1 and e > s:
-            return json.loads(text[s : e + 1])
-        raise
-
-
 def build_persona_titles_prompt(
     company: Dict[str, str],
     persona: Dict[str, str],
@@ -114,23 +127,8 @@ Return JSON only:
 """.strip()
 
 
-def call_with_fallback(client: OpenAI, prompt: str) -> str:
-    last_err = None
-    for m in MODEL_CANDIDATES:
-        try:
-            r = client.responses.create(
-                model=m,
-                input=prompt,
-                max_output_tokens=800,
-            )
-            return r.output_text.strip()
-        except Exception as e:
-            last_err = e
-    raise last_err
-
-
-def generate_titles_grouped_by_persona_fast(
-    client: OpenAI,
+async def generate_titles_grouped_by_persona_fast(
+    client: AsyncOpenAI,
     request: Dict[str, Any],
     result: Dict[str, Any],
     n_titles_per_persona: int = 7,
@@ -161,12 +159,14 @@ def generate_titles_grouped_by_persona_fast(
         "personas": [],
     }
 
-    for persona in personas:
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def _one(persona: Dict[str, str]) -> Dict[str, Any]:
         prompt = build_persona_titles_prompt(
             company, persona, subreddits, hints, n_titles_per_persona, cluster_catalog
         )
-        raw = call_with_fallback(client, prompt)
-        obj = parse_json_loose(raw)
+        async with sem:
+            obj = await call_structured(client, MODEL_CANDIDATES, prompt, PersonaTitles, MAX_OUTPUT_TOKENS)
 
         arc_label = str(obj.get("arc_label", "persona arc")).strip()
         items = obj.get("items", [])
@@ -194,14 +194,15 @@ def generate_titles_grouped_by_persona_fast(
                 }
             )
 
-        payload["personas"].append(
-            {
-                "persona_username": persona["persona_username"],
-                "arc_label": arc_label,
-                "n_titles": len(cleaned),
-                "titles": cleaned,
-            }
-        )
+        return {
+            "persona_username": persona["persona_username"],
+            "arc_label": arc_label,
+            "n_titles": len(cleaned),
+            "titles": cleaned,
+        }
+
+    # One request per persona, all in flight at once (bounded by sem); gather keeps persona order
+    payload["personas"] = list(await asyncio.gather(*(_one(persona) for persona in personas)))
 
     return payload
 
@@ -217,14 +218,16 @@ def main(company_dir: str, n_titles_per_persona: int = 7):
     if not os.getenv("OPENAI_API_KEY"):
         raise EnvironmentError("OPENAI_API_KEY is not set in environment")
 
-    client = OpenAI()
+    async def _generate() -> Dict[str, Any]:
+        async with AsyncOpenAI() as client:
+            return await generate_titles_grouped_by_persona_fast(
+                client=client,
+                request=request,
+                result=clusters,
+                n_titles_per_persona=n_titles_per_persona,
+            )
 
-    out = generate_titles_grouped_by_persona_fast(
-        client=client,
-        request=request,
-        result=clusters,
-        n_titles_per_persona=n_titles_per_persona,
-    )
+    out = asyncio.run(_generate())
 
     out_path = p / "titles.json"
     write_json(out_path, out)
@@ -1,25 +1,28 @@
-import json
 import sys
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import orjson
+
+try:
+    from pipeline._embed import encode_cached, similarity_matrix
+    from pipeline._routed import write_routed_meta, write_routed_rows
+except ImportError:
+    from _embed import encode_cached, similarity_matrix
+    from _routed import write_routed_meta, write_routed_rows
 
 
 def read_json(p: Path) -> Dict[str, Any]:
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
-
-
-def write_json(p: Path, obj: Dict[str, Any]) -> None:
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    return orjson.loads(p.read_bytes())
 
 
 def _norm_text(s: str) -> str:
-    return " ".join((s or "").split()).strip()
+    # split() already drops leading/trailing whitespace, so no strip() is needed
+    return " ".join((s or "").split())
 
 
 def build_subreddit_docs(subreddits: List[str]) -> List[str]:
@@ -30,15 +33,12 @@ def build_subreddit_docs(subreddits: List[str]) -> List[str]:
     return docs
 
 
-def build_title_docs_for_routing(
-    title: str,
+def build_routing_context(
     company: Optional[Dict[str, str]] = None,
     persona: Optional[Dict[str, str]] = None,
-    cluster_theme: Optional[str] = None,
 ) -> str:
-    parts = [f"title: {_norm_text(title)}"]
-    if cluster_theme:
-        parts.append(f"cluster_theme: {_norm_text(cluster_theme)}")
+    """Normalized company/persona lines shared by every title of one persona."""
+    parts = []
     if company:
         parts.append(f"company: {_norm_text(company.get('name',''))}")
         parts.append(f"company_description: {_norm_text(company.get('description',''))}")
@@ -48,102 +48,134 @@ def build_title_docs_for_routing(
     return "\n".join(parts)
 
 
+def build_title_docs_for_routing(
+    title: str,
+    context: str = "",
+    cluster_theme: Optional[str] = None,
+) -> str:
+    parts = [f"title: {_norm_text(title)}"]
+    if cluster_theme:
+        parts.append(f"cluster_theme: {_norm_text(cluster_theme)}")
+    if context:
+        parts.append(context)
+    return "\n".join(parts)
+
+
 def reassign_subreddits_cosine(
     request: Dict[str, Any],
     persona_titles_payload: Dict[str, Any],
     model_name: str = "all-MiniLM-L6-v2",
     top_k: int = 3,
     diversity_boost: bool = True,
-) -> Dict[str, Any]:
+    cache_dir: Optional[Path] = None,
+) -> Tuple[Dict[str, Any], Iterator[Tuple[int, Dict[str, Any]]]]:
+    """
+    Returns (header, rows). header holds meta and the persona fields; rows lazily
+    yields (persona_index, routed title) in persona order, so each routed copy can
+    be written out as soon as it is built.
+    """
     subreddits = request.get("subreddits", [])
     if not subreddits:
         raise ValueError("request['subreddits'] is empty")
 
-    flattened = []
+    # One pass builds the routing docs and the persona skeleton; slots only reference
+    # the input titles, routed copies are made one at a time when rows are consumed
+    company = request.get("company")
+    out_personas = []
+    title_docs = []
+    out_slots = []
     for p_idx, p in enumerate(persona_titles_payload.get("personas", [])):
-        for t_idx, t in enumerate(p.get("titles", [])):
-            flattened.append((p_idx, t_idx, p, t))
+        out_personas.append({k: v for k, v in p.items() if k != "titles"})
+        context = build_routing_context(
+            company=company,
+            persona={
+                "persona_username": p.get("persona_username", ""),
+                "info": p.get("info", ""),
+            },
+        )
+        for t in p.get("titles", []):
+            title_docs.append(
+                build_title_docs_for_routing(
+                    title=t.get("title", ""),
+                    context=context,
+                    cluster_theme=t.get("cluster_theme") or None,
+                )
+            )
+            out_slots.append((p_idx, t))
 
-    if not flattened:
+    if not out_slots:
         raise ValueError("No titles found in titles.json payload")
 
-    emb_model = SentenceTransformer(model_name)
-
     subreddit_docs = build_subreddit_docs(subreddits)
-    sr_emb = emb_model.encode(
+    sr_emb = encode_cached(
+        model_name,
         subreddit_docs,
-        batch_size=64,
-        show_progress_bar=True,
+        cache_dir,
+        batch_size=128,
+        show_progress_bar=False,
         normalize_embeddings=True,
     )
 
-    title_docs = []
-    for _, _, persona_obj, t in flattened:
-        title_docs.append(
-            build_title_docs_for_routing(
-                title=t.get("title", ""),
-                company=request.get("company"),
-                persona={
-                    "persona_username": persona_obj.get("persona_username", ""),
-                    "info": persona_obj.get("info", ""),
-                },
-                cluster_theme=t.get("cluster_theme") or None,
-            )
-        )
-
-    title_emb = emb_model.encode(
+    title_emb = encode_cached(
+        model_name,
         title_docs,
-        batch_size=64,
-        show_progress_bar=True,
+        cache_dir,
+        batch_size=128,
+        show_progress_bar=False,
         normalize_embeddings=True,
     )
 
-    sim = title_emb @ sr_emb.T
-
-    used_counts = {sr: 0 for sr in subreddits}
-    assigned = []
-
-    for i in range(sim.shape[0]):
-        scores = sim[i].copy()
-
-        if diversity_boost:
-            penalties = np.array([0.03 * used_counts[sr] for sr in subreddits], dtype=float)
-            scores = scores - penalties
-
-        top_idx = np.argsort(scores)[::-1][:top_k]
-        candidates = [
-            {"subreddit": subreddits[int(j)], "score": float(sim[i][int(j)])}
-            for j in top_idx
-        ]
-
-        best_j = int(top_idx[0])
-        best_sr = subreddits[best_j]
-        used_counts[best_sr] += 1
-
-        assigned.append((best_sr, candidates))
-
-    out = {
+    # float32 (GPU matmul when available) so the penalty subtraction and partitioning never upcast
+    sim = similarity_matrix(title_emb, sr_emb)
+
+    k = min(top_k, len(subreddits))
+
+    if diversity_boost:
+        # Each pick penalises its subreddit for later titles, so rows stay sequential
+        used_counts = np.zeros(len(subreddits), dtype=np.float32)
+        penalty = np.float32(0.03)
+        rows = []
+        for i in range(sim.shape[0]):
+            scores = sim[i] - penalty * used_counts
+
+            # O(S) partition for the k best, then sort just those k
+            top_idx = np.argpartition(-scores, k - 1)[:k]
+            top_idx = top_idx[np.argsort(-scores[top_idx])]
+
+            used_counts[top_idx[0]] += 1
+            rows.append(top_idx)
+        top_idx_all = np.array(rows, dtype=np.intp).reshape(-1, k)
+    else:
+        top_idx_all = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sim, top_idx_all, axis=1), axis=1)
+        top_idx_all = np.take_along_axis(top_idx_all, order, axis=1)
+
+    top_scores = np.take_along_axis(sim, top_idx_all, axis=1)
+
+    def rows() -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for (p_idx, t), top_idx, scores in zip(out_slots, top_idx_all, top_scores):
+            top_idx, scores = top_idx.tolist(), scores.tolist()
+            yield p_idx, {
+                **t,
+                "subreddit_assigned": subreddits[top_idx[0]],
+                "subreddit_candidates": [
+                    {"subreddit": subreddits[j], "score": score}
+                    for j, score in zip(top_idx, scores)
+                ],
+            }
+
+    header = {
         "meta": {
             "embedding_model": model_name,
             "top_k": top_k,
             "diversity_boost": diversity_boost,
             "num_subreddits": len(subreddits),
-            "num_titles": len(flattened),
+            "num_titles": len(out_slots),
         },
-        "personas": [],
+        "personas": out_personas,
     }
 
-    for p in persona_titles_payload.get("personas", []):
-        out["personas"].append({k: v for k, v in p.items() if k != "titles"} | {"titles": []})
-
-    for idx, (p_idx, _t_idx, _p, t) in enumerate(flattened):
-        best_sr, candidates = assigned[idx]
-        new_t = dict(t)
-        new_t["subreddit_assigned"] = best_sr
-        new_t["subreddit_candidates"] = candidates
-        out["personas"][p_idx]["titles"].append(new_t)
-
-    return out
+    return header, rows()
 
 
 def main(company_dir: str):
@@ -152,22 +184,32 @@ def main(company_dir: str):
     request = read_json(p / "request.json")
     titles_payload = read_json(p / "titles.json")
 
-    routed = reassign_subreddits_cosine(
+    header, rows = reassign_subreddits_cosine(
         request=request,
         persona_titles_payload=titles_payload,
         model_name="all-MiniLM-L6-v2",
         top_k=3,
         diversity_boost=True,
+        cache_dir=p / ".cache",
     )
 
-    out_path = p / "titles_routed.json"
-    write_json(out_path, routed)
+    # Rows go straight to the JSONL as they are built; keep only the few needed for the preview
+    preview = defaultdict(list)
+
+    def _tap(rows):
+        for p_idx, t in rows:
+            if p_idx < 2 and len(preview[p_idx]) < 3:
+                preview[p_idx].append(t)
+            yield p_idx, t
+
+    write_routed_meta(p, header["meta"], header["personas"])
+    out_path = write_routed_rows(p, _tap(rows))
     print(f"Wrote: {out_path}")
 
     # quick preview (first 2 personas, first 3 titles)
-    for person in routed.get("personas", [])[:2]:
+    for p_idx, person in enumerate(header["personas"][:2]):
         print(f"\nPersona: {person.get('persona_username','')}")
-        for t in person.get("titles", [])[:3]:
+        for t in preview[p_idx]:
             top3 = [(c["subreddit"], round(c["score"], 3)) for c in t.get("subreddit_candidates", [])]
             print("-", t.get("title", ""))
             print("  assigned:", t.get("subreddit_assigned", ""), "| top3:", top3)
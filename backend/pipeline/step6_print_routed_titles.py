@@ -1,21 +1,22 @@
-import json
 import sys
 from pathlib import Path
-from typing import Any, Dict
 
-
-def read_json(p: Path) -> Dict[str, Any]:
-    if not p.exists():
-        raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+try:
+    from pipeline._routed import iter_routed_rows, read_routed_meta
+except ImportError:
+    from _routed import iter_routed_rows, read_routed_meta
 
 
 def main(company_dir: str):
     p = Path(company_dir)
-    routed = read_json(p / "titles_routed.json")
+    meta = read_routed_meta(p)
+
+    # Title rows are streamed; they are stored in persona order
+    rows = iter_routed_rows(p)
+    row = next(rows, None)
 
     print("\nPer persona detailed output")
-    for person in routed.get("personas", []):
+    for p_idx, person in enumerate(meta.get("personas", [])):
         persona_user = person.get("persona_username", "")
         persona_info = person.get("info", "") or person.get("persona_info", "")
 
@@ -25,7 +26,10 @@ def main(company_dir: str):
             preview = persona_info[:220].replace("\n", " ")
             print("Info preview:", preview + ("..." if len(persona_info) > 220 else ""))
 
-        for t in person.get("titles", []):
+        while row is not None and row[0] == p_idx:
+            t = row[1]
+            row = next(rows, None)
+
             title = t.get("title", "")
             assigned_sr = t.get("subreddit_assigned", "")
 
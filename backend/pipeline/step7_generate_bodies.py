@@ -1,62 +1,65 @@
-import json
+import asyncio
 import os
 import re
 import sys
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Any, Dict, List
 
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+try:
+    from pipeline._llm import call_structured, call_with_fallback, parse_json_loose
+    from pipeline._routed import read_routed
+except ImportError:
+    from _llm import call_structured, call_with_fallback, parse_json_loose
+    from _routed import read_routed
 
 
 MODEL_CANDIDATES = ["gpt-4.1-mini", "gpt-4o-mini"]
+MAX_CONCURRENT_REQUESTS = 8
+MAX_OUTPUT_TOKENS_PER_BODY = 120
+TEMPERATURE = 0.4
+
+_SENT_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+# Checked in order; each intent's keywords are plain substrings folded into one alternation
+_INTENT_PATTERNS = tuple(
+    (intent, re.compile("|".join(map(re.escape, keywords))))
+    for intent, keywords in (
+        ("compare", (" vs ", " versus ", "compare", "comparison")),
+        ("alternatives", ("alternative", "alternatives")),
+        ("recommendation", ("best", "recommend", "recommendation")),
+        ("workflow_help", ("how do i", "how to", "workflow", "faster", "automate", "automation")),
+    )
+)
 
 
-def read_json(p: Path) -> Dict[str, Any]:
-    if not p.exists():
-        raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+class PostBody(BaseModel):
+    index: int
+    body: str
 
 
-def write_json(p: Path, obj: Dict[str, Any]) -> None:
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+class PostBodies(BaseModel):
+    bodies: List[PostBody]
 
 
-def parse_json_loose(text: str) -> Dict[str, Any]:
-    try:
-        return json.loads(text)
-    except Exception:
-        s, e = text.find("{"), text.rfind("}")
-        if s != -1 and e != -1 and e > s:
-            return json.loads(text[s : e + 1])
-        raise
+def read_json(p: Path) -> Dict[str, Any]:
+    if not p.exists():
+        raise FileNotFoundError(f"Missing file: {p}")
+    return orjson.loads(p.read_bytes())
 
 
-def call_with_fallback(client: OpenAI, prompt: str) -> str:
-    last_err = None
-    for m in MODEL_CANDIDATES:
-        try:
-            r = client.responses.create(
-                model=m,
-                input=prompt,
-                max_output_tokens=120,
-                temperature=0.4,
-            )
-            return r.output_text.strip()
-        except Exception as e:
-            last_err = e
-    raise last_err
+def write_json(p: Path, obj: Dict[str, Any]) -> None:
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 
 def infer_post_intent(title: str) -> str:
     t = (title or "").lower()
-    if any(x in t for x in [" vs ", " versus ", "compare", "comparison"]):
-        return "compare"
-    if any(x in t for x in ["alternative", "alternatives"]):
-        return "alternatives"
-    if any(x in t for x in ["best", "recommend", "recommendation"]):
-        return "recommendation"
-    if any(x in t for x in ["how do i", "how to", "workflow", "faster", "automate", "automation"]):
-        return "workflow_help"
+    for intent, pattern in _INTENT_PATTERNS:
+        if pattern.search(t):
+            return intent
     return "general_question"
 
 
@@ -67,23 +70,32 @@ def title_mentions_company(title: str, company_name: str) -> bool:
 def build_body_prompt(
     company: Dict[str, str],
     persona: Dict[str, str],
-    subreddit: str,
-    title: str,
-    intent: str,
-    allow_company_mention: bool,
+    posts: List[Dict[str, Any]],
 ) -> str:
-    company_rule = (
-        f"You may mention {company['name']} only if it feels unavoidable from the title context."
-        if allow_company_mention
-        else f"Do not mention {company['name']} or any brand/product names."
-    )
+    """
+    One prompt for all of a persona's posts.
+    Each post dict carries title, subreddit, intent and allow_company_mention.
+    """
+    blocks = []
+    for i, post in enumerate(posts, start=1):
+        company_rule = (
+            f"may mention {company['name']} only if it feels unavoidable from the title context"
+            if post["allow_company_mention"]
+            else f"do not mention {company['name']} or any brand/product names"
+        )
+        blocks.append(
+            f"Post {i}:\n"
+            f"Subreddit: {post['subreddit']}\n"
+            f"Title: {post['title']}\n"
+            f"Intent type: {post['intent']}\n"
+            f"Company mention: {company_rule}"
+        )
+    posts_text = "\n\n".join(blocks)
 
     return f"""
-Write a Reddit post body that feels like a real OP. Keep it short.
+Write a Reddit post body for each post below that feels like a real OP. Keep them short.
 
-Subreddit: {subreddit}
-Title: {title}
-Intent type: {intent}
+{posts_text}
 
 Persona voice anchor:
 username: {persona["persona_username"]}
@@ -93,19 +105,44 @@ Company context (for background only):
 {company["name"]}: {company["description"]}
 
 Hard rules:
-- Exactly 1 or 2 sentences.
+- Each body is exactly 1 or 2 sentences.
 - Sound like a normal Reddit post, not formal writing.
 - Usually a question or a request for suggestions.
 - No marketing language. No emojis. No call to action.
-- {company_rule}
+- Follow each post's company mention rule.
 
-Output JSON only:
-{{"body":"..."}}
+Output JSON only, with exactly {len(posts)} entries, one per post index:
+{{"bodies":[{{"index":1,"body":"..."}}]}}
 """.strip()
 
 
-def generate_bodies_1to2_sentences(
-    client: OpenAI,
+def parse_bodies(reply: Dict[str, Any], n_posts: int) -> Dict[int, str]:
+    """Map 1-based post index -> body for every well-formed entry in a reply."""
+    entries = reply.get("bodies", []) if isinstance(reply, dict) else []
+    if not isinstance(entries, list):
+        return {}
+
+    by_index: Dict[int, str] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            idx = int(entry.get("index"))
+        except (TypeError, ValueError):
+            continue
+        body = entry.get("body")
+        if 1 <= idx <= n_posts and isinstance(body, str) and body.strip():
+            by_index[idx] = body.strip()
+    return by_index
+
+
+def trim_body(body: str) -> str:
+    sentences = _SENT_SPLIT.split(body.strip())
+    return " ".join(sentences[:2]).strip()
+
+
+async def generate_bodies_1to2_sentences(
+    client: AsyncOpenAI,
     request: Dict[str, Any],
     routed_payload: Dict[str, Any],
 ) -> Dict[str, Any]:
@@ -120,42 +157,73 @@ def generate_bodies_1to2_sentences(
     }
 
     persona_lookup = {p["persona_username"]: p for p in request.get("personas", [])}
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
+    async def _one(persona_ctx: Dict[str, str], titles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        posts = []
+        for t in titles:
+            title = t.get("title", "")
+            posts.append(
+                {
+                    "title": title,
+                    "subreddit": t.get("subreddit_assigned") or t.get("subreddit") or "",
+                    "intent": infer_post_intent(title),
+                    "allow_company_mention": title_mentions_company(title, company["name"]),
+                }
+            )
+        if not posts:
+            return []
+
+        prompt = build_body_prompt(company, persona_ctx, posts)
+        async with sem:
+            reply = await call_structured(
+                client,
+                MODEL_CANDIDATES,
+                prompt,
+                PostBodies,
+                MAX_OUTPUT_TOKENS_PER_BODY * len(posts),
+                TEMPERATURE,
+            )
+        bodies = parse_bodies(reply, len(posts))
+
+        # Anything the model dropped from the batch reply gets its own single-post prompt.
+        # If even that reply has no usable entry, ask once more in plain text and keep the
+        # raw reply as the body, as before structured outputs.
+        async def _retry(i: int) -> str:
+            prompt_one = build_body_prompt(company, persona_ctx, [posts[i - 1]])
+            async with sem:
+                reply_one = await call_structured(
+                    client, MODEL_CANDIDATES, prompt_one, PostBodies, MAX_OUTPUT_TOKENS_PER_BODY, TEMPERATURE
+                )
+                body = parse_bodies(reply_one, 1).get(1)
+                if body is None:
+                    raw_one = await call_with_fallback(
+                        client, MODEL_CANDIDATES, prompt_one, MAX_OUTPUT_TOKENS_PER_BODY, TEMPERATURE
+                    )
+                    try:
+                        body = parse_bodies(parse_json_loose(raw_one), 1).get(1)
+                    except ValueError:
+                        body = None
+                    body = body or raw_one.strip().strip('"')
+            if not body:
+                raise ValueError(f"No body generated for post: {posts[i - 1]['title']!r}")
+            return body
+
+        missing = [i for i in range(1, len(posts) + 1) if i not in bodies]
+        bodies.update(zip(missing, await asyncio.gather(*(_retry(i) for i in missing))))
+
+        return [{**t, "body": trim_body(bodies[i])} for i, t in enumerate(titles, start=1)]
+
+    # One prompt per persona, all personas in flight at once (bounded by sem); gather keeps order
+    personas = []
     for p in routed_payload.get("personas", []):
         pu = p.get("persona_username", "")
         pinfo = p.get("info") or persona_lookup.get(pu, {}).get("info", "")
-        persona_ctx = {"persona_username": pu, "info": pinfo}
-
-        persona_block = {"persona_username": pu, "titles": []}
-
-        for t in p.get("titles", []):
-            subreddit = t.get("subreddit_assigned") or t.get("subreddit") or ""
-            title = t.get("title", "")
-            intent = infer_post_intent(title)
+        personas.append(({"persona_username": pu, "info": pinfo}, p.get("titles", [])))
 
-            allow_company = title_mentions_company(title, company["name"])
-
-            prompt = build_body_prompt(
-                company=company,
-                persona=persona_ctx,
-                subreddit=subreddit,
-                title=title,
-                intent=intent,
-                allow_company_mention=allow_company,
-            )
-
-            raw = call_with_fallback(client, prompt)
-            try:
-                body = parse_json_loose(raw).get("body", "").strip()
-            except Exception:
-                body = raw.strip().strip('"')
-
-            sentences = re.split(r"(?<=[.!?])\s+", body.strip())
-            body = " ".join(sentences[:2]).strip()
-
-            persona_block["titles"].append({**t, "body": body})
-
-        out["personas"].append(persona_block)
+    results = await asyncio.gather(*(_one(ctx, titles) for ctx, titles in personas))
+    for (ctx, _), titles in zip(personas, results):
+        out["personas"].append({"persona_username": ctx["persona_username"], "titles": titles})
 
     return out
 
@@ -164,18 +232,20 @@ def main(company_dir: str):
     p = Path(company_dir)
 
     request = read_json(p / "request.json")
-    routed = read_json(p / "titles_routed.json")
+    routed = read_routed(p)
 
     if not os.getenv("OPENAI_API_KEY"):
         raise EnvironmentError("OPENAI_API_KEY is not set in environment")
 
-    client = OpenAI()
+    async def _generate() -> Dict[str, Any]:
+        async with AsyncOpenAI() as client:
+            return await generate_bodies_1to2_sentences(
+                client=client,
+                request=request,
+                routed_payload=routed,
+            )
 
-    persona_posts_payload = generate_bodies_1to2_sentences(
-        client=client,
-        request=request,
-        routed_payload=routed,
-    )
+    persona_posts_payload = asyncio.run(_generate())
 
     out_path = p / "posts_with_bodies.json"
     write_json(out_path, persona_posts_payload)
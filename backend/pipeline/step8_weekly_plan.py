@@ -1,11 +1,14 @@
-import json
 import sys
 from pathlib import Path
-from collections import defaultdict
 from typing import Dict, Any, List, Tuple
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import orjson
+
+try:
+    from pipeline._embed import encode_rows_cached
+except ImportError:
+    from _embed import encode_rows_cached
 
 A = 3  # max posts per persona per week
 B = 2  # max posts per subreddit per week
@@ -13,15 +16,17 @@ C = 1  # max posts per persona-subreddit pair per week
 
 SIM_THRESHOLD_SAME_SUBREDDIT = 0.82
 
+EMBED_BATCH_SIZE = 256
+
 
 def read_json(p: Path) -> Dict[str, Any]:
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
 def write_json(p: Path, obj: Any) -> None:
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 
 def flatten_posts(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -44,32 +49,50 @@ def flatten_posts(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
     return posts
 
 
-def cosine_sim(u: np.ndarray, v: np.ndarray) -> float:
-    return float(np.dot(u, v))
-
-
-def build_embeddings_matrix(posts: List[Dict[str, Any]], model_name: str = "all-MiniLM-L6-v2") -> np.ndarray:
-    model = SentenceTransformer(model_name)
+def build_embeddings_matrix(
+    posts: List[Dict[str, Any]],
+    model_name: str = "all-MiniLM-L6-v2",
+    cache_path: Path | None = None,
+) -> np.ndarray:
+    """
+    One L2-normalized embedding row per post. With cache_path, rows are cached
+    per post text, so a rerun only encodes titles that are new or changed.
+    """
     texts = [
         f"{p.get('title','')} | {p.get('subreddit','')} | cluster {p.get('cluster_id','')}"
         for p in posts
     ]
-    emb = model.encode(texts, normalize_embeddings=True, show_progress_bar=True, batch_size=64)
-    return np.asarray(emb, dtype=float)
+    emb = encode_rows_cached(
+        model_name,
+        texts,
+        cache_path,
+        batch_size=EMBED_BATCH_SIZE,
+        show_progress_bar=False,
+        normalize_embeddings=True,
+    )
+    # MiniLM output is float32 and L2-normalized; float64 would only double memory traffic
+    return np.asarray(emb, dtype=np.float32)
 
 
-def violates_similarity(
-    cand_idx: int,
-    chosen_indices: List[int],
-    posts: List[Dict[str, Any]],
-    emb: np.ndarray,
-) -> bool:
-    cand_sr = posts[cand_idx]["subreddit"]
-    for j in chosen_indices:
-        if posts[j]["subreddit"] == cand_sr:
-            if cosine_sim(emb[cand_idx], emb[j]) >= SIM_THRESHOLD_SAME_SUBREDDIT:
-                return True
-    return False
+# Per-mode score terms: (new subreddit, repeat subreddit, new persona, repeat persona,
+# new cluster, repeat cluster, whether the early-index bonus applies)
+SCORE_TERMS = {
+    "strict": (2.0, -0.2, 1.5, -0.1, 1.0, -0.3, True),
+    "relaxed": (1.0, -0.1, 0.8, -0.05, 0.6, -0.2, False),
+}
+
+
+def encode_column(values: List[Any]) -> Tuple[np.ndarray, int]:
+    """Integer codes in first-seen order (works for None and mixed types, unlike np.unique)."""
+    codes: Dict[Any, int] = {}
+    out = np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype=np.intp, count=len(values))
+    return out, len(codes)
+
+
+def group_indices_by_code(codes: np.ndarray, n_codes: int) -> List[np.ndarray]:
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(n_codes + 1))
+    return [order[bounds[c] : bounds[c + 1]] for c in range(n_codes)]
 
 
 def schedule_weeks(
@@ -77,101 +100,97 @@ def schedule_weeks(
     emb: np.ndarray,
     target_posts_per_week: int,
 ) -> List[Dict[str, Any]]:
-    remaining_indices = list(range(len(posts)))
+    # Removing a picked post is remaining[i] = False; candidates stay in index order
+    remaining = np.ones(len(posts), dtype=bool)
+    n_remaining = len(posts)
+
+    # Integer-coded candidate columns so feasibility and scores are computed as whole vectors
+    P, n_personas = encode_column([p["persona_username"] for p in posts])
+    S, n_subreddits = encode_column([p["subreddit"] for p in posts])
+    cluster_ids = [p.get("cluster_id") for p in posts]
+    has_cluster = np.fromiter((cid is not None for cid in cluster_ids), dtype=bool, count=len(posts))
+    Cl, n_clusters = encode_column(cluster_ids)
+    PS = P * n_subreddits + S
+    index_bonus = np.fromiter(
+        (
+            0.15 * (1.0 / max(1, idxp)) if isinstance(idxp, int) else 0.0
+            for idxp in (p.get("index_in_persona") for p in posts)
+        ),
+        dtype=float,
+        count=len(posts),
+    )
+    sr_to_indices = group_indices_by_code(S, n_subreddits)
 
     weeks: List[Dict[str, Any]] = []
     week_num = 1
 
-    while remaining_indices:
+    while n_remaining:
         chosen_idx: List[int] = []
 
-        persona_count = defaultdict(int)
-        subreddit_count = defaultdict(int)
-        pair_count = defaultdict(int)
-        cluster_count = defaultdict(int)
-
-        def can_take(i: int, persona_cap: int, subreddit_cap: int) -> bool:
-            pu = posts[i]["persona_username"]
-            sr = posts[i]["subreddit"]
-            pair = (pu, sr)
-
-            if persona_count[pu] >= persona_cap:
-                return False
-            if subreddit_count[sr] >= subreddit_cap:
-                return False
-            if pair_count[pair] >= C:
-                return False
-            if violates_similarity(i, chosen_idx, posts, emb):
-                return False
-            return True
-
-        def score_of(i: int, mode: str = "strict") -> float:
-            pu = posts[i]["persona_username"]
-            sr = posts[i]["subreddit"]
-            cid = posts[i].get("cluster_id")
-            idxp = posts[i].get("index_in_persona")
-
-            if mode == "strict":
-                score = 0.0
-                score += 2.0 if subreddit_count[sr] == 0 else -0.2
-                score += 1.5 if persona_count[pu] == 0 else -0.1
-                if cid is not None:
-                    score += 1.0 if cluster_count[cid] == 0 else -0.3
-                if isinstance(idxp, int):
-                    score += 0.15 * (1.0 / max(1, idxp))
-                return score
-
-            score = 0.0
-            score += 1.0 if subreddit_count[sr] == 0 else -0.1
-            score += 0.8 if persona_count[pu] == 0 else -0.05
-            if cid is not None:
-                score += 0.6 if cluster_count[cid] == 0 else -0.2
+        # Per-week counters indexed by the integer codes above; pairs are pid * n_subreddits + sid
+        persona_count = np.zeros(n_personas, dtype=np.int32)
+        subreddit_count = np.zeros(n_subreddits, dtype=np.int32)
+        pair_count = np.zeros(n_personas * n_subreddits, dtype=np.int32)
+        cluster_count = np.zeros(n_clusters, dtype=np.int32)
+
+        # max_sim[i]: highest similarity of i to a post already chosen this week in the same
+        # subreddit. Each pick folds in one GEMV over its subreddit's rows, so the similarity
+        # check is a single array compare instead of a rescan of the chosen posts.
+        max_sim = np.full(len(posts), -np.inf, dtype=np.float32)
+
+        def scores_of(mode: str) -> np.ndarray:
+            # Terms are added in the same order as the scalar version so float sums match exactly
+            sr_new, sr_rep, pu_new, pu_rep, cl_new, cl_rep, use_bonus = SCORE_TERMS[mode]
+            score = np.where(subreddit_count[S] == 0, sr_new, sr_rep)
+            score = score + np.where(persona_count[P] == 0, pu_new, pu_rep)
+            cluster_term = np.where(cluster_count[Cl] == 0, cl_new, cl_rep)
+            score = score + np.where(has_cluster, cluster_term, 0.0)
+            if use_bonus:
+                score = score + index_bonus
             return score
 
         def pick_one(persona_cap: int, subreddit_cap: int, mode: str) -> int | None:
-            best_idx = None
-            best_score = -1e9
-
-            for pos, cand_i in enumerate(remaining_indices):
-                if not can_take(cand_i, persona_cap, subreddit_cap):
-                    continue
-
-                sc = score_of(cand_i, mode=mode)
-                if sc > best_score:
-                    best_score = sc
-                    best_idx = pos
-
-            if best_idx is None:
+            nonlocal n_remaining
+            feasible = (
+                remaining
+                & (persona_count[P] < persona_cap)
+                & (subreddit_count[S] < subreddit_cap)
+                & (pair_count[PS] < C)
+                & (max_sim < SIM_THRESHOLD_SAME_SUBREDDIT)
+            )
+            if not feasible.any():
                 return None
 
-            chosen_global_i = remaining_indices.pop(best_idx)
-
-            pu = posts[chosen_global_i]["persona_username"]
-            sr = posts[chosen_global_i]["subreddit"]
-            pair = (pu, sr)
-            cid = posts[chosen_global_i].get("cluster_id")
+            # argmax keeps the first (lowest-index) of equal scores, matching the old strict ">" scan
+            chosen_global_i = int(np.argmax(np.where(feasible, scores_of(mode), -np.inf)))
+            remaining[chosen_global_i] = False
+            n_remaining -= 1
 
             chosen_idx.append(chosen_global_i)
-            persona_count[pu] += 1
-            subreddit_count[sr] += 1
-            pair_count[pair] += 1
-            if cid is not None:
-                cluster_count[cid] += 1
+            persona_count[P[chosen_global_i]] += 1
+            subreddit_count[S[chosen_global_i]] += 1
+            pair_count[PS[chosen_global_i]] += 1
+            if has_cluster[chosen_global_i]:
+                cluster_count[Cl[chosen_global_i]] += 1
+
+            same_sr = sr_to_indices[S[chosen_global_i]]
+            max_sim[same_sr] = np.maximum(max_sim[same_sr], emb[same_sr] @ emb[chosen_global_i])
 
             return chosen_global_i
 
-        while remaining_indices and len(chosen_idx) < target_posts_per_week:
+        while n_remaining and len(chosen_idx) < target_posts_per_week:
             if pick_one(A, B, mode="strict") is None:
                 break
 
-        if remaining_indices and len(chosen_idx) < target_posts_per_week:
+        if n_remaining and len(chosen_idx) < target_posts_per_week:
             relax_A = A + 1
             relax_B = B + 1
-            while remaining_indices and len(chosen_idx) < target_posts_per_week:
+            while n_remaining and len(chosen_idx) < target_posts_per_week:
                 if pick_one(relax_A, relax_B, mode="relaxed") is None:
                     break
 
         chosen_posts = [posts[i] for i in chosen_idx]
+        chosen_arr = np.array(chosen_idx, dtype=np.intp)
 
         weeks.append(
             {
@@ -179,9 +198,9 @@ def schedule_weeks(
                 "posts": chosen_posts,
                 "counts": {
                     "num_posts": len(chosen_posts),
-                    "unique_personas": len({p["persona_username"] for p in chosen_posts}),
-                    "unique_subreddits": len({p["subreddit"] for p in chosen_posts}),
-                    "unique_clusters": len({p.get("cluster_id") for p in chosen_posts}),
+                    "unique_personas": len(np.unique(P[chosen_arr])),
+                    "unique_subreddits": len(np.unique(S[chosen_arr])),
+                    "unique_clusters": len(np.unique(Cl[chosen_arr])),
                 },
             }
         )
@@ -225,7 +244,7 @@ def main(company_dir: str):
     if not posts:
         raise ValueError("No posts found in posts_with_bodies.json")
 
-    emb = build_embeddings_matrix(posts)
+    emb = build_embeddings_matrix(posts, cache_path=p / ".cache" / "embeddings_cache.npz")
 
     weekly_plan = schedule_weeks(posts, emb, target_posts_per_week=target)
     weekly_plan = strip_raw_fields(weekly_plan)
@@ -1,43 +1,68 @@
-import json
+import re
 import sys
 from pathlib import Path
 from datetime import datetime, timedelta
 from collections import defaultdict
+from functools import lru_cache
 import hashlib
+import zlib
+from bisect import bisect_left, insort
+
+import numpy as np
+import orjson
+
+SECONDS_PER_DAY = 86400
+FALLBACK_STEP_SECONDS = 45 * 60
+
+# Keyword intents in priority order. Each group is a plain-substring alternation inside a
+# lookahead, so finditer tries every start position in one scan and overlapping hits are kept
+_INTENT_KEYWORDS = (
+    ("compare", (" vs ", " versus ", "compare", "comparison")),
+    ("alternatives", ("alternative", "alternatives")),
+    ("recommendation", ("best", "recommend", "recommendation")),
+    ("workflow", ("how to", "workflow", "automate", "automation", "faster")),
+)
+_INTENT_RE = re.compile(
+    "(?=" + "|".join(f"({'|'.join(map(re.escape, kws))})" for _, kws in _INTENT_KEYWORDS) + ")"
+)
+
+# Placement order within a week: questions first, comparisons last
+INTENT_ORDER = {"question": 0, "recommendation": 1, "workflow": 2, "general": 3, "alternatives": 4, "compare": 5}
 
 
 def read_json(p: Path):
     if not p.exists():
         raise FileNotFoundError(f"Missing file: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
 def write_json(p: Path, obj):
-    p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 
 def _stable_hash_int(s: str) -> int:
-    h = hashlib.sha256(s.encode("utf-8")).hexdigest()
-    return int(h[:12], 16)
+    # Only seeds jitter/window offsets deterministically; no need for a crypto hash
+    return zlib.crc32(s.encode("utf-8")) & 0xFFFFFFFF
 
 
 def infer_intent_from_text(title: str, body: str | None = None) -> str:
     t = (title or "").lower()
     b = (body or "").lower() if body else ""
     text = t + " " + b
-    if any(x in text for x in [" vs ", " versus ", "compare", "comparison"]):
-        return "compare"
-    if any(x in text for x in ["alternative", "alternatives"]):
-        return "alternatives"
-    if any(x in text for x in ["best", "recommend", "recommendation"]):
-        return "recommendation"
-    if any(x in text for x in ["how to", "workflow", "automate", "automation", "faster"]):
-        return "workflow"
+    best = len(_INTENT_KEYWORDS)
+    for m in _INTENT_RE.finditer(text):
+        # lastindex is the 1-based group that matched; lower means higher priority
+        best = min(best, m.lastindex - 1)
+        if best == 0:
+            break
+    if best < len(_INTENT_KEYWORDS):
+        return _INTENT_KEYWORDS[best][0]
     if "?" in (title or ""):
         return "question"
     return "general"
 
 
+@lru_cache(maxsize=None)
 def subreddit_vibe_score(subreddit: str) -> str:
     s = (subreddit or "").lower()
     if any(k in s for k in ["powerpoint", "slides", "presentation", "consult", "startup", "productivity", "design"]):
@@ -47,36 +72,51 @@ def subreddit_vibe_score(subreddit: str) -> str:
     return "general"
 
 
-def too_close(dt: datetime, others: list[datetime], min_gap_hours: int) -> bool:
-    for o in others:
-        if abs((dt - o).total_seconds()) < min_gap_hours * 3600:
-            return True
-    return False
+def too_close(t: int, sorted_times: list[int], min_gap_hours: int) -> bool:
+    """
+    t and sorted_times are whole seconds on the same clock. Only the two
+    neighbours of t in the sorted list can be the closest, so bisect finds them.
+    """
+    gap = min_gap_hours * 3600
+    i = bisect_left(sorted_times, t)
+    if i < len(sorted_times) and sorted_times[i] - t < gap:
+        return True
+    return i > 0 and t - sorted_times[i - 1] < gap
+
+
+def too_close_any(t: int, times: np.ndarray, min_gap_hours: int) -> bool:
+    """Unsorted-array variant of too_close: one vectorized distance check."""
+    return times.size > 0 and bool(np.abs(times - t).min() < min_gap_hours * 3600)
 
 
 def pick_time_in_window(
-    base_date: datetime,
+    day_start: int,
     persona: str,
     subreddit: str,
     title: str,
     window: tuple[int, int],
     salt: str,
-) -> datetime:
+) -> int:
+    """Whole-minute time inside window on the day starting at day_start (seconds)."""
     start_h, end_h = window
     window_minutes = max(1, (end_h - start_h) * 60)
     seed = f"{persona}|{subreddit}|{title}|{salt}"
     h = _stable_hash_int(seed)
     offset = h % window_minutes
-    hour = start_h + (offset // 60)
-    minute = offset % 60
-    return base_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return day_start + start_h * 3600 + offset * 60
 
 
-def derive_week_params(posts: list[dict]) -> dict:
+def derive_week_params(
+    posts: list[dict],
+    intents: list[str] | None = None,
+    vibes: list[str] | None = None,
+) -> dict:
     personas = [p.get("persona_username", "") for p in posts if p.get("persona_username")]
     subs = [p.get("subreddit", "") for p in posts if p.get("subreddit")]
-    intents = [infer_intent_from_text(p.get("title", ""), p.get("body")) for p in posts]
-    vibes = [subreddit_vibe_score(p.get("subreddit", "")) for p in posts]
+    if intents is None:
+        intents = [infer_intent_from_text(p.get("title", ""), p.get("body")) for p in posts]
+    if vibes is None:
+        vibes = [subreddit_vibe_score(p.get("subreddit", "")) for p in posts]
 
     uniq_personas = max(1, len(set(personas)))
     uniq_subs = max(1, len(set(subs)))
@@ -149,22 +189,49 @@ def derive_time_windows_for_day(weekday: int, post_vibe: str, post_intent: str,
     return clean
 
 
+def day_scores(
+    day_load: np.ndarray,
+    day_capacity: np.ndarray,
+    subreddit_posts: np.ndarray,
+    persona_posts: np.ndarray,
+    prefers_early: bool,
+    jitters: np.ndarray,
+) -> np.ndarray:
+    """
+    Placement score for all 7 days at once. subreddit_posts/persona_posts are this
+    post's per-day counts; terms are added in a fixed order so results are reproducible.
+    """
+    busy = day_load > 0
+    consecutive = np.where(np.r_[False, busy[:-1]], 1.0, 0.0) + np.where(np.r_[busy[1:], False], 0.7, 0.0)
+
+    score = np.where(day_load < day_capacity, 3.0, -4.0)
+    score = score - consecutive
+    score = score + np.where(subreddit_posts == 0, 1.4, -0.6)
+    score = score + np.where(persona_posts == 0, 0.9, -0.9 * persona_posts)
+    if prefers_early:
+        score = score + (6 - np.arange(7)) * 0.02
+    return score + jitters
+
+
 def _day_targets(n: int, week_seed: str, max_per_day: int) -> list[int]:
     targets = [0] * 7
     if n <= 0:
         return targets
 
-    for i in range(n):
-        base = int((i * 7) / n)
-        j = (_stable_hash_int(f"{week_seed}|jitter|{i}") % 3) - 1
-        d = (base + j) % 7
+    # Per-post jitter (-1..1) and probe stride (1..3) from the bytes of one variable-length
+    # digest of week_seed (n bytes each), instead of two hashes per post
+    draws = np.frombuffer(hashlib.shake_256(f"{week_seed}|targets".encode("utf-8")).digest(2 * n), dtype=np.uint8)
+    jitter = (draws[:n] % 3).astype(np.int64) - 1
+    stride = 1 + (draws[n:] % 3).astype(np.int64)
+    preferred = ((np.arange(n) * 7) // n + jitter) % 7
 
-        stride = 1 + (_stable_hash_int(f"{week_seed}|stride|{i}") % 3)
+    # Bounded fill stays sequential: each post sees the slots taken before it
+    for d, step in zip(preferred.tolist(), stride.tolist()):
         for _ in range(7):
             if targets[d] < max_per_day:
                 targets[d] += 1
                 break
-            d = (d + stride) % 7
+            d = (d + step) % 7
     return targets
 
 
@@ -173,140 +240,146 @@ def schedule_week_posts_rolling(posts: list[dict], week_start: datetime) -> list
     if n == 0:
         return []
 
-    week_params = derive_week_params(posts)
+    # Intent and vibe once per post; the sort, week params and placement loop all reuse them
+    intents = [infer_intent_from_text(p.get("title", ""), p.get("body")) for p in posts]
+    vibes = [subreddit_vibe_score(p.get("subreddit", "")) for p in posts]
 
-    def sort_key(p):
-        intent = infer_intent_from_text(p.get("title", ""), p.get("body"))
-        order = {"question": 0, "recommendation": 1, "workflow": 2, "general": 3, "alternatives": 4, "compare": 5}
-        return order.get(intent, 3)
+    week_params = derive_week_params(posts, intents, vibes)
 
-    posts_sorted = sorted(posts, key=sort_key)
+    # Decorate once, then sort indices with a C-level key lookup
+    sort_keys = [INTENT_ORDER.get(intent, 3) for intent in intents]
+    order = sorted(range(n), key=sort_keys.__getitem__)
 
-    days = [(week_start + timedelta(days=d)).replace(hour=0, minute=0, second=0, microsecond=0) for d in range(7)]
+    # All times are whole seconds since midnight of day 0; datetimes are only built for output
+    day0 = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_starts = [d * SECONDS_PER_DAY for d in range(7)]
+    weekdays = [(day0 + timedelta(days=d)).weekday() for d in range(7)]
 
     week_seed = f"{week_start.date().isoformat()}|n={n}|p={week_params['uniq_personas']}|s={week_params['uniq_subs']}"
-    day_capacity = _day_targets(n, week_seed, max_per_day=week_params["max_per_day"])
-
-    persona_times = defaultdict(list)
+    day_capacity = np.array(_day_targets(n, week_seed, max_per_day=week_params["max_per_day"]), dtype=np.int32)
+
+    persona_ids = {}
+    subreddit_ids = {}
+    for p in posts:
+        persona_ids.setdefault(p.get("persona_username", ""), len(persona_ids))
+        subreddit_ids.setdefault(p.get("subreddit", ""), len(subreddit_ids))
+
+    # Each persona's placed times live in a preallocated int64 row sized to its post count
+    # this week; persona_n[pid] is how many are filled
+    posts_per_persona = np.bincount([persona_ids[p.get("persona_username", "")] for p in posts])
+    persona_times = np.empty((len(persona_ids), int(posts_per_persona.max())), dtype=np.int64)
+    persona_n = np.zeros(len(persona_ids), dtype=np.int32)
+    # Sorted, for bisect-based gap checks
     subreddit_times_by_day = defaultdict(list)
-    day_load = [0] * 7
+    # Per-day post counts feeding day_scores. Persona counts use the day the time actually
+    # falls on (fallback times can spill past midnight), subreddit counts the day slot
+    persona_day_count = np.zeros((len(persona_ids), 7), dtype=np.int32)
+    subreddit_day_count = np.zeros((len(subreddit_ids), 7), dtype=np.int32)
+    day_load = np.zeros(7, dtype=np.int32)
     scheduled = []
 
-    def consecutive_penalty(d: int) -> float:
-        left = day_load[d - 1] if d - 1 >= 0 else 0
-        right = day_load[d + 1] if d + 1 <= 6 else 0
-        return (1.0 if left > 0 else 0.0) + (0.7 if right > 0 else 0.0)
+    # week_params is fixed for the week, so windows depend only on (weekday, vibe, intent)
+    windows_table: dict[tuple[int, str, str], list[tuple[int, int]]] = {}
+
+    def windows_for(weekday: int, vibe: str, intent: str) -> list[tuple[int, int]]:
+        key = (weekday, vibe, intent)
+        windows = windows_table.get(key)
+        if windows is None:
+            windows = windows_table[key] = derive_time_windows_for_day(
+                weekday=weekday,
+                post_vibe=vibe,
+                post_intent=intent,
+                week_params=week_params,
+            )
+        return windows
 
     base_order = list(range(7))
     base_order.sort(key=lambda d: (_stable_hash_int(f"{week_seed}|order|{d}") % 1000, d))
+    base_order = np.array(base_order)
 
-    for post in posts_sorted:
+    for i in order:
+        post = posts[i]
         persona = post.get("persona_username", "")
         subreddit = post.get("subreddit", "")
         title = post.get("title", "")
-        body = post.get("body")
-
-        intent = infer_intent_from_text(title, body)
-        vibe = subreddit_vibe_score(subreddit)
-
-        def day_score(d: int) -> float:
-            score = 0.0
-
-            if day_load[d] < day_capacity[d]:
-                score += 3.0
-            else:
-                score -= 4.0
 
-            score -= consecutive_penalty(d)
-
-            if len(subreddit_times_by_day[(d, subreddit)]) == 0:
-                score += 1.4
-            else:
-                score -= 0.6
-
-            same_day_persona = len([t for t in persona_times[persona] if t.date() == days[d].date()])
-            if same_day_persona == 0:
-                score += 0.9
-            else:
-                score -= 0.9 * same_day_persona
-
-            if intent in ["question", "workflow", "recommendation"]:
-                score += (6 - d) * 0.02
-
-            score += (_stable_hash_int(f"{persona}|{subreddit}|{title}|day{d}") % 100) / 10000.0
-            return score
-
-        day_order = sorted(base_order, key=day_score, reverse=True)
+        intent = intents[i]
+        vibe = vibes[i]
+
+        prefers_early = intent in ["question", "workflow", "recommendation"]
+        # Tie-breakers for the 7 days from one 8-byte digest (first 7 bytes) instead of 7 hashes
+        digest = hashlib.blake2b(f"{persona}|{subreddit}|{title}".encode("utf-8"), digest_size=8).digest()
+        jitters = (np.frombuffer(digest, dtype=np.uint8)[:7] % 100) / 10000.0
+        pid = persona_ids[persona]
+        sid = subreddit_ids[subreddit]
+        placed = persona_times[pid, : persona_n[pid]]
+
+        scores = day_scores(
+            day_load,
+            day_capacity,
+            subreddit_day_count[sid],
+            persona_day_count[pid],
+            prefers_early,
+            jitters,
+        )
+        # Best first; the stable sort keeps base_order among ties
+        day_order = base_order[np.argsort(-scores[base_order], kind="stable")].tolist()
 
-        placed = False
+        chosen = None
         for d in day_order:
-            base_date = days[d]
-            weekday = base_date.weekday()
-
-            windows = derive_time_windows_for_day(
-                weekday=weekday,
-                post_vibe=vibe,
-                post_intent=intent,
-                week_params=week_params,
-            )
+            windows = windows_for(weekdays[d], vibe, intent)
 
             attempts = windows + windows
 
             for w_idx, win in enumerate(attempts):
-                candidate_dt = pick_time_in_window(
-                    base_date, persona, subreddit, title, win, salt=f"{week_seed}|{d}|{w_idx}"
+                t = pick_time_in_window(
+                    day_starts[d], persona, subreddit, title, win, salt=f"{week_seed}|{d}|{w_idx}"
                 )
 
-                if too_close(candidate_dt, persona_times[persona], week_params["min_gap_persona_hours"]):
+                if too_close_any(t, placed, week_params["min_gap_persona_hours"]):
                     continue
-                if too_close(candidate_dt, subreddit_times_by_day[(d, subreddit)], week_params["min_gap_subreddit_hours"]):
+                if too_close(t, subreddit_times_by_day[(d, subreddit)], week_params["min_gap_subreddit_hours"]):
                     continue
 
-                persona_times[persona].append(candidate_dt)
-                subreddit_times_by_day[(d, subreddit)].append(candidate_dt)
-                day_load[d] += 1
-
-                scheduled.append({**post, "scheduled_at": candidate_dt.isoformat()})
-                placed = True
+                chosen = (d, t)
                 break
 
-            if placed:
+            if chosen is not None:
                 break
 
-        if not placed:
+        if chosen is None:
             remaining = [(day_capacity[d] - day_load[d], d) for d in range(7)]
             remaining.sort(reverse=True)
-            d = remaining[0][1] if remaining[0][0] > 0 else int(min(range(7), key=lambda x: day_load[x]))
+            d = remaining[0][1] if remaining[0][0] > 0 else int(np.argmin(day_load))
 
-            base_date = days[d]
-            weekday = base_date.weekday()
+            windows = windows_for(weekdays[d], vibe, intent)
 
-            windows = derive_time_windows_for_day(
-                weekday=weekday,
-                post_vibe=vibe,
-                post_intent=intent,
-                week_params=week_params,
-            )
-
-            candidate_dt = pick_time_in_window(
-                base_date, persona, subreddit, title, windows[0], salt=f"{week_seed}|fallback"
+            t = pick_time_in_window(
+                day_starts[d], persona, subreddit, title, windows[0], salt=f"{week_seed}|fallback"
             )
 
             for _ in range(24):
                 if (
-                    not too_close(candidate_dt, persona_times[persona], week_params["min_gap_persona_hours"])
-                    and not too_close(candidate_dt, subreddit_times_by_day[(d, subreddit)], week_params["min_gap_subreddit_hours"])
+                    not too_close_any(t, placed, week_params["min_gap_persona_hours"])
+                    and not too_close(t, subreddit_times_by_day[(d, subreddit)], week_params["min_gap_subreddit_hours"])
                 ):
                     break
-                candidate_dt += timedelta(minutes=45)
-
-            persona_times[persona].append(candidate_dt)
-            subreddit_times_by_day[(d, subreddit)].append(candidate_dt)
-            day_load[d] += 1
-            scheduled.append({**post, "scheduled_at": candidate_dt.isoformat()})
-
-    scheduled.sort(key=lambda x: x["scheduled_at"])
-    return scheduled
+                t += FALLBACK_STEP_SECONDS
+            chosen = (d, t)
+
+        d, t = chosen
+        persona_times[pid, persona_n[pid]] = t
+        persona_n[pid] += 1
+        if t < 7 * SECONDS_PER_DAY:
+            persona_day_count[pid, t // SECONDS_PER_DAY] += 1
+        insort(subreddit_times_by_day[(d, subreddit)], t)
+        subreddit_day_count[sid, d] += 1
+        day_load[d] += 1
+        scheduled.append((t, post))
+
+    # Stable sort on time keeps insertion order for equal times, as sorting the ISO strings did
+    scheduled.sort(key=lambda x: x[0])
+    return [{**post, "scheduled_at": (day0 + timedelta(seconds=t)).isoformat()} for t, post in scheduled]
 
 
 def assign_schedule_rolling(weekly_plan: list[dict], start_dt: datetime | None = None) -> list[dict]: